@@ -5,6 +5,7 @@ from __future__ import annotations  # PEP 563 (allows annotation forward refs)
 import sys
 
 import os
+import errno
 from os import path
 import re
 from datetime import datetime
@@ -27,13 +28,14 @@ from db_edu_util import (
     working_directory,
 )
 from db_edu_util.databricks import DatabricksError
-from grizzled.file import eglob
+from fnmatch import fnmatch
+from concurrent.futures import Future, ThreadPoolExecutor
+import uuid
 from bdc.bdcutil import *
 from string import Template as StringTemplate
 import dataclasses
 from dataclasses import dataclass
 from tempfile import TemporaryDirectory
-import codecs
 import shutil
 import git
 
@@ -52,6 +54,7 @@ from typing import (
     Union,
     Callable,
     Set,
+    List,
 )
 
 __all__ = [
@@ -76,7 +79,7 @@ __all__ = [
 # (Some constants are below the class definitions.)
 # ---------------------------------------------------------------------------
 
-VERSION = "1.39.0"
+VERSION = "1.40.0"
 
 DEFAULT_BUILD_FILE = "build.yaml"
 PROG = os.path.basename(sys.argv[0])
@@ -185,6 +188,13 @@ VERSION_NOTEBOOK_FILE = "Version-{0}.scala"
 
 ANSWERS_NOTEBOOK_PATTERN = re.compile("^.*_answers\..*$")
 
+# The name of a trash path created by _remove_in_background(). Use as a
+# format string, with {0} as the name of the path being removed and {1} as a
+# unique hex string. Because the name of the removed path is included,
+# leftovers from an interrupted run can be recognized (see
+# _leftover_trash()), without touching anything else.
+TRASH_NAME_FORMAT = ".{0}.bdc-trash-{1}"
+
 # ---------------------------------------------------------------------------
 # Globals
 # ---------------------------------------------------------------------------
@@ -248,9 +258,12 @@ class UnknownFieldsError(BuildConfigError):
         :param bad_keys:       the bad fields
         """
         keys = ", ".join(bad_keys)
-        super(BuildConfigError, self).__init__(
+        super().__init__(
             f'"{parent_section}": Bad fields in "{section}" section: {keys}'
         )
+        self.parent_section = parent_section
+        self.section = section
+        self.bad_keys = bad_keys
 
 
 # ---------------------------------------------------------------------------
@@ -827,6 +840,7 @@ class BuildData(DefaultStrMixin):
         profiles: Optional[Set[master_parse.Profile]] = None,
         variables: Optional[Dict[AnyStr, AnyStr]] = None,
         bundle_info: Optional[Bundle] = None,
+        dbc_compression_level: Optional[int] = None,
     ):
         """
         Create a new BuildData object.
@@ -848,6 +862,8 @@ class BuildData(DefaultStrMixin):
         :param profiles:            set of profiles, if any
         :param variables:           a map of user-defined variables
         :param bundle_info          Bundle data, if any
+        :param dbc_compression_level: zlib compression level for the DBCs,
+                                    or None for the default
         """
         super(BuildData, self).__init__()
         self.build_file_path = build_file_path
@@ -878,6 +894,7 @@ class BuildData(DefaultStrMixin):
         self.notebook_type_map = notebook_type_map
         self.variables = variables or {}
         self.bundle_info = bundle_info
+        self.dbc_compression_level = dbc_compression_level
 
         if top_dbc_folder_name is None:
             top_dbc_folder_name = "${course_name}"
@@ -891,7 +908,7 @@ class BuildData(DefaultStrMixin):
             },
         )
 
-        self.top_dbc_folder_name = VariableSubstituter(top_dbc_folder_name).substitute(
+        self.top_dbc_folder_name = variable_substituter(top_dbc_folder_name).substitute(
             folder_vars
         )
 
@@ -1063,7 +1080,7 @@ def load_build_yaml(yaml_file: str) -> BuildData:
 
         fields.update(extra_vars)
 
-        adj_dest = VariableSubstituter(adj_dest).safe_substitute(fields)
+        adj_dest = variable_substituter(adj_dest).safe_substitute(fields)
 
         # Restore escaped variables.
         escaped = re.compile(r"^([^@]*)@([^@]+)@(.*)$")
@@ -1486,6 +1503,22 @@ def load_build_yaml(yaml_file: str) -> BuildData:
 
         return res
 
+    def parse_compression_level() -> Optional[int]:
+        level = contents.get("dbc_compression_level")
+        if level is not None:
+            if isinstance(level, bool) or not isinstance(level, int):
+                raise BuildConfigError(
+                    f'Bad value of "{level}" for "dbc_compression_level": '
+                    + "It must be an integer."
+                )
+            if not (0 <= level <= 9):
+                raise BuildConfigError(
+                    f'Bad value of "{level}" for "dbc_compression_level": '
+                    + "It must be between 0 and 9."
+                )
+
+        return level
+
     def parse_course_type(
         data: Dict[str, Any], section: str
     ) -> master_parse.CourseType:
@@ -1570,7 +1603,7 @@ def load_build_yaml(yaml_file: str) -> BuildData:
         }
 
         def sub(filename: str) -> str:
-            return VariableSubstituter(filename).substitute(fields)
+            return variable_substituter(filename).substitute(fields)
 
         return OutputInfo(
             student_dir=student_dir,
@@ -1731,6 +1764,7 @@ def load_build_yaml(yaml_file: str) -> BuildData:
         variables=variables,
         profiles=profiles,
         bundle_info=bundle_info,
+        dbc_compression_level=parse_compression_level(),
     )
 
     return data
@@ -1774,8 +1808,8 @@ def expand_template(
     variables["course_info"] = course_info_vars
 
     output = joinpath(tempdir, path.basename(src_template_file))
-    with codecs.open(src_template_file, mode="r", encoding="utf8") as i:
-        with codecs.open(output, mode="w", encoding="utf8") as o:
+    with open(src_template_file, mode="r", encoding="utf8", newline="") as i:
+        with open(output, mode="w", encoding="utf8", newline="") as o:
             o.write(pystache.render(i.read(), variables))
 
     return output
@@ -1911,7 +1945,9 @@ def process_master_notebook(
 
     :return: None
     """
-    verbose(f"notebook={notebook}\ndest_root={dest_root}")
+    # NotebookData's string form is expensive to build, so defer it until
+    # we know verbose messages are actually enabled.
+    verbose(lambda: f"notebook={notebook}\ndest_root={dest_root}")
     notebook_type_map = build.notebook_type_map
     student_labs_subdir = build.output_info.student_labs_subdir
     instructor_labs_subdir = build.output_info.instructor_labs_subdir
@@ -1938,11 +1974,12 @@ def process_master_notebook(
             lang_ext = LANG_EXT[lc_lang]
 
             # The master parse tool created <notebook-basename>/<lang>/*
-            # in the temporary directory. The following recursive glob pattern
-            # will make finding the files simple. In this glob pattern, {0} is
-            # the notebook type (e.g., "_answers"), and {1} is the file
+            # in the temporary directory. Scan that directory tree once; the
+            # resulting DirEntry objects are then matched, in memory, against
+            # a file name pattern for each notebook type. In this pattern, {0}
+            # is the notebook type (e.g., "_answers"), and {1} is the file
             # extension (e.g., ".py")
-            glob_template = "**/*{0}*{1}"
+            glob_template = "*{0}*{1}"
 
             # Copy all answers notebooks and exercises notebooks to the student
             # labs directory. Copy all instructor notebooks to the instructor
@@ -1961,15 +1998,16 @@ def process_master_notebook(
 
             base, _ = path.splitext(path.basename(notebook.src))
             mp_notebook_dir = joinpath(temp_output_dir, base, lc_lang)
+            generated = _scan_files(mp_notebook_dir)
 
             lang_dir = lc_lang.capitalize()
             for notebook_type, target_dir in types_and_targets:
-                # Use a recursive glob pattern to find all matching notebooks.
-                # Note that eglob returns a generator.
                 copied = 0
                 suffix = NotebookType.suffix_for(notebook_type)
                 glob_pattern = glob_template.format(suffix, lang_ext)
-                matches = eglob(glob_pattern, mp_notebook_dir)
+                matches = [
+                    e.path for e in generated if fnmatch(e.name, glob_pattern)
+                ]
                 ext = LANG_EXT[lc_lang]
                 fields = merge_dicts(
                     notebook.variables,
@@ -1979,7 +2017,7 @@ def process_master_notebook(
                         NOTEBOOK_TYPE: notebook_type_map.get(notebook_type, ""),
                     },
                 )
-                dest_subst = VariableSubstituter(notebook.dest).safe_substitute(fields)
+                dest_subst = variable_substituter(notebook.dest).safe_substitute(fields)
                 if dest_subst.startswith(os.path.sep):
                     dest_subst = dest_subst[len(os.path.sep) :]
 
@@ -2002,7 +2040,7 @@ def process_master_notebook(
         # destination, from which we can then extract the base file name.
         lang = list(EXT_LANG.values())[0]  # Just choose one. It doesn't matter.
         ext = LANG_EXT[lang.lower()]
-        nb_dest_subst = VariableSubstituter(notebook.dest).safe_substitute(
+        nb_dest_subst = variable_substituter(notebook.dest).safe_substitute(
             merge_dicts(
                 notebook.variables,
                 {
@@ -2016,7 +2054,7 @@ def process_master_notebook(
         target_basename, _ = os.path.splitext(os.path.basename(nb_dest_subst))
 
         # Now we can do substitution on the instructor notes target.
-        final_dest = VariableSubstituter(final_dest).safe_substitute(
+        final_dest = variable_substituter(final_dest).safe_substitute(
             merge_dicts(notebook.variables, {"target_basename": target_basename})
         )
 
@@ -2131,7 +2169,7 @@ def create_consolidated_inst_notes_index(build: BuildData, dest_root: str) -> No
             if len(html_files) == 0:
                 return
 
-            with codecs.open(index_md, mode="w", encoding="utf-8") as f:
+            with open(index_md, mode="w", encoding="utf-8", newline="") as f:
                 print(
                     "# Instructor Notes for " f"{build.course_info.course_title}\n",
                     file=f,
@@ -2184,8 +2222,10 @@ def copy_notebooks(
                 profile=profile,
             )
         else:
+            # The labs directory is just a staging area for the DBC, so
+            # there's no need to preserve the notebook's metadata.
             dest_path = joinpath(labs_dir, notebook.dest)
-            copy(src_path, dest_path)
+            copy(src_path, dest_path, preserve_metadata=False)
 
         remove_empty_subdirectories(dest_root)
 
@@ -2290,6 +2330,7 @@ def make_dbc(build: BuildData, labs_dir: str, dbc_path: str) -> NoReturn:
             flatten=False,
             verbose=verbosity_is_enabled(),
             debugging=False,
+            compresslevel=build.dbc_compression_level,
         )
     finally:
         pass
@@ -2302,10 +2343,13 @@ def copy_slides(build: BuildData, dest_root: str) -> NoReturn:
     if build.slides:
         for f in build.slides:
             src = joinpath(build.source_base, f.src)
-            dest = joinpath(
-                dest_root, build.output_info.instructor_dir, SLIDES_SUBDIR, f.dest
-            )
-            copy(src, dest)
+            copy(src, _slide_target(build, dest_root, f))
+
+
+def _slide_target(build: BuildData, dest_root: str, slide: SlideData) -> str:
+    return joinpath(
+        dest_root, build.output_info.instructor_dir, SLIDES_SUBDIR, slide.dest
+    )
 
 
 def copy_misc_files(
@@ -2326,8 +2370,8 @@ def copy_misc_files(
                 dest = dest_root
 
             t = joinpath(dest_root, dest)
-            if f.dest_is_dir and (not path.isdir(t)):
-                os.mkdir(t)
+            if f.dest_is_dir:
+                mkdirp(t)
             copy_info_file(s, t, f.is_template, build, profile)
 
 
@@ -2338,9 +2382,7 @@ def copy_datasets(build: BuildData, dest_root: str) -> NoReturn:
     if build.datasets:
 
         def target_for(file, dest):
-            return joinpath(
-                dest_root, build.output_info.student_dir, DATASETS_SUBDIR, dest, file
-            )
+            return joinpath(_dataset_target_dir(build, dest_root, dest), file)
 
         for ds in build.datasets:
             source = joinpath(build.course_directory, ds.src)
@@ -2356,17 +2398,158 @@ def copy_datasets(build: BuildData, dest_root: str) -> NoReturn:
                 html_to_pdf(html, pdf)
 
 
+def _dataset_target_dir(build: BuildData, dest_root: str, dest: str) -> str:
+    return joinpath(dest_root, build.output_info.student_dir, DATASETS_SUBDIR, dest)
+
+
+def _plan_directories(build: BuildData, dest_root: str) -> Set[str]:
+    """
+    Determine the output directories that copy_slides(), copy_datasets() and
+    copy_misc_files() will need, so they can all be created up front, rather
+    than once per copied file. Only directories that will receive a file are
+    included, so no empty directories end up in the build.
+
+    :param build:     the parsed build information
+    :param dest_root: the top-level destination directory
+
+    :return: the set of directories
+    """
+    dirs = set()
+    for f in build.slides or []:
+        dirs.add(path.dirname(_slide_target(build, dest_root, f)))
+    for ds in build.datasets or []:
+        dirs.add(_dataset_target_dir(build, dest_root, ds.dest))
+    for f in build.misc_files or []:
+        dest = f.dest
+        if dest == ".":
+            dest = dest_root
+        t = joinpath(dest_root, dest)
+        dirs.add(t if f.dest_is_dir else path.dirname(t))
+
+    return dirs
+
+
+def _scan_files(directory: str) -> Sequence[os.DirEntry]:
+    """
+    Recursively find all regular files under a directory. This function uses
+    os.scandir(), so the returned entries carry cached file type information,
+    and no additional stat() calls are necessary to filter them.
+
+    :param directory: the directory to scan. It need not exist.
+
+    :return: a list of os.DirEntry objects for the files, in directory
+             traversal order
+    """
+    files = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    files.extend(_scan_files(entry.path))
+                elif entry.is_file():
+                    files.append(entry)
+    except FileNotFoundError:
+        pass
+
+    return files
+
+
+def _remove_in_background(parent_dir: str, paths: Sequence[str]) -> Optional[Future]:
+    """
+    Remove files or directories without making the caller wait for the
+    deletion. Each path is atomically renamed to a uniquely named trash
+    path within `parent_dir` (which must be on the same file system), and
+    the trash paths are then deleted in a separate thread. A mount point,
+    which can't be renamed, is removed synchronously instead.
+
+    :param parent_dir: where to put the trash paths
+    :param paths:      the paths to remove. Paths that don't exist are
+                       ignored.
+
+    :return: a Future for the deletion, or None if there was nothing to
+             remove. The caller must call its result() method, which waits
+             for the deletion and raises any error it encountered.
+    """
+    trash = []
+    for p in paths:
+        t = joinpath(
+            parent_dir, TRASH_NAME_FORMAT.format(path.basename(p), uuid.uuid4().hex)
+        )
+        try:
+            os.rename(p, t)
+        except FileNotFoundError:
+            # Either it never existed, or it was nested within a path that
+            # has already been moved.
+            continue
+        except OSError as e:
+            # A mount point (e.g., a bind-mounted output directory) can't be
+            # renamed, but its contents can still be removed.
+            if e.errno not in (errno.EXDEV, errno.EBUSY):
+                raise
+            rm_rf(p)
+            continue
+        trash.append(t)
+
+    if not trash:
+        return None
+
+    def remove_all():
+        for t in trash:
+            rm_rf(t)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(remove_all)
+    executor.shutdown(wait=False)
+    return future
+
+
+def _leftover_trash(removed_path: str) -> List[str]:
+    """
+    Find trash paths that _remove_in_background() created for a path, but
+    never removed (e.g., because bdc was killed before the background
+    deletion finished). Only trash created from a path with the same name,
+    in the same directory, is returned.
+
+    :param removed_path: the path that was removed
+
+    :return: the paths of the leftover trash directories and files
+    """
+    removed_path = path.abspath(removed_path)
+    pattern = re.compile(
+        re.escape(TRASH_NAME_FORMAT.format(path.basename(removed_path), ""))
+        + "[0-9a-f]{32}"
+    )
+    try:
+        with os.scandir(path.dirname(removed_path)) as it:
+            return [e.path for e in it if pattern.fullmatch(e.name)]
+    except FileNotFoundError:
+        return []
+
+
 def remove_empty_subdirectories(directory: str) -> NoReturn:
-    for dirpath, _, _ in os.walk(directory, topdown=False):
-        if len(os.listdir(dirpath)) == 0:
+    def prune(dirpath: str) -> bool:
+        # Returns True if dirpath was empty (once its empty subdirectories
+        # were pruned) and was deleted. Uses the file type information
+        # cached by scandir(), rather than re-listing each directory.
+        empty = True
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                if not (entry.is_dir(follow_symlinks=False) and prune(entry.path)):
+                    empty = False
+
+        if empty:
             verbose(f"Deleting empty directory {dirpath}")
             os.rmdir(dirpath)
+        return empty
+
+    if path.isdir(directory):
+        prune(directory)
 
 
 def write_version_notebook(dir: str, notebook_contents: str, version: str) -> NoReturn:
     nb_path = joinpath(dir, VERSION_NOTEBOOK_FILE.format(version))
     ensure_parent_dir_exists(nb_path)
-    with codecs.open(nb_path, "w", encoding="UTF-8") as out:
+    with open(nb_path, "w", encoding="UTF-8", newline="") as out:
         out.write(notebook_contents)
 
 
@@ -2399,15 +2582,12 @@ def bundle_course(
 
 def do_build(
     build: BuildData, base_dest_dir: str, profile: Optional[master_parse.Profile] = None
-) -> NoReturn:
+) -> Optional[Future]:
     if profile:
         dest_dir = joinpath(base_dest_dir, profile.name)
     else:
         dest_dir = base_dest_dir
 
-    for d in (build.output_info.instructor_dir, build.output_info.student_dir):
-        mkdirp(joinpath(dest_dir, d))
-
     try:
         # Get a Git Repo object. Since we don't really know where the
         # root of the repo is, let GitPython figure it out from the
@@ -2433,38 +2613,74 @@ def do_build(
             "git_commit": git_commit,
         },
     )
-    version_notebook = VariableSubstituter(VERSION_NOTEBOOK_TEMPLATE).substitute(fields)
+    version_notebook = variable_substituter(VERSION_NOTEBOOK_TEMPLATE).substitute(
+        fields
+    )
 
     labs_full_path = joinpath(dest_dir, build.output_info.student_labs_subdir)
     copy_notebooks(build, labs_full_path, dest_dir, profile)
     copy_instructor_notes(build, dest_dir, profile)
     write_version_notebook(labs_full_path, version_notebook, version)
 
-    student_dbc = joinpath(
-        dest_dir, build.output_info.student_dir, build.output_info.student_dbc
-    )
-    make_dbc(build=build, labs_dir=labs_full_path, dbc_path=student_dbc)
-
-    instructor_labs = joinpath(dest_dir, build.output_info.instructor_labs_subdir)
-    if os.path.exists(instructor_labs):
-        instructor_dbc = joinpath(
-            dest_dir, build.output_info.instructor_dir, build.output_info.instructor_dbc
+    # The student and instructor DBCs are independent of each other, and
+    # most of the work of building one is compression (zlib releases the
+    # GIL), so build them concurrently.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        student_dbc = joinpath(
+            dest_dir, build.output_info.student_dir, build.output_info.student_dbc
         )
-        write_version_notebook(instructor_labs, version_notebook, version)
-        make_dbc(build, instructor_labs, instructor_dbc)
+        futures = [
+            executor.submit(
+                make_dbc, build=build, labs_dir=labs_full_path, dbc_path=student_dbc
+            )
+        ]
+
+        instructor_labs = joinpath(dest_dir, build.output_info.instructor_labs_subdir)
+        if os.path.exists(instructor_labs):
+            instructor_dbc = joinpath(
+                dest_dir,
+                build.output_info.instructor_dir,
+                build.output_info.instructor_dbc,
+            )
+            write_version_notebook(instructor_labs, version_notebook, version)
+            futures.append(
+                executor.submit(make_dbc, build, instructor_labs, instructor_dbc)
+            )
 
-    copy_slides(build, dest_dir)
-    copy_misc_files(build, dest_dir, profile)
-    copy_datasets(build, dest_dir)
+        for future in futures:
+            future.result()
+
+    # Create all the directories the remaining copy steps need in one pass
+    # (shortest paths, i.e., parents, first). This has to happen after the
+    # notebooks are copied, because copy_notebooks() prunes empty
+    # directories.
+    for d in sorted(_plan_directories(build, dest_dir), key=len):
+        mkdirp(d)
+
+    # The slides, miscellaneous files and datasets land in disjoint parts of
+    # the destination tree, and copying them is almost entirely I/O, so let
+    # them overlap. Calling result() on each future re-raises any exception
+    # (e.g., BuildError) here, in the main thread.
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(copy_slides, build, dest_dir),
+            executor.submit(copy_misc_files, build, dest_dir, profile),
+            executor.submit(copy_datasets, build, dest_dir),
+        ]
+        for future in futures:
+            future.result()
 
     if build.bundle_info:
         bundle_course(build, dest_dir, profile)
 
     # Finally, remove the instructor labs folder and the student labs
-    # folder.
+    # folder. The DBCs are already built, so the (potentially slow) deletion
+    # can happen in the background. The caller must wait for the returned
+    # Future.
     if not build.keep_lab_dirs:
-        rm_rf(labs_full_path)
-        rm_rf(instructor_labs)
+        return _remove_in_background(dest_dir, [labs_full_path, instructor_labs])
+
+    return None
 
 
 def build_course(build: BuildData, dest_dir: str, overwrite: bool) -> NoReturn:
@@ -2480,6 +2696,10 @@ def build_course(build: BuildData, dest_dir: str, overwrite: bool) -> NoReturn:
         raise BuildError(f"{build.course_info.name} is deprecated and cannot be built.")
 
     verbose(f'Publishing to "{dest_dir}"')
+    # Remove any trash an interrupted run left behind, along with (if
+    # overwriting) the previous build, which is moved out of the way and
+    # deleted while the new one is being built.
+    to_remove = _leftover_trash(dest_dir)
     if path.isdir(dest_dir):
         if not overwrite:
             raise BuildError(
@@ -2487,21 +2707,35 @@ def build_course(build: BuildData, dest_dir: str, overwrite: bool) -> NoReturn:
                 "specify overwrite."
             )
 
-        rm_rf(dest_dir)
+        to_remove.append(dest_dir)
 
-    if not build.profiles:
-        do_build(build, dest_dir, profile=None)
-    else:
-        for profile in build.profiles:
-            info("")
-            msg = f"Building profile {profile.name}"
-            info("-" * len(msg))
-            info(msg)
-            info("-" * len(msg))
-            do_build(build, dest_dir, profile)
+    cleanups = [_remove_in_background(path.dirname(path.abspath(dest_dir)), to_remove)]
 
-    if errors > 0:
-        raise BuildError(f"{errors} error(s).")
+    try:
+        if not build.profiles:
+            cleanups.append(do_build(build, dest_dir, profile=None))
+        else:
+            for profile in build.profiles:
+                info("")
+                msg = f"Building profile {profile.name}"
+                info("-" * len(msg))
+                info(msg)
+                info("-" * len(msg))
+                cleanups.append(do_build(build, dest_dir, profile))
+
+        if errors > 0:
+            raise BuildError(f"{errors} error(s).")
+    except BaseException:
+        # Wait for the deletions, but report the build's error, not theirs.
+        for f in cleanups:
+            if f is not None:
+                f.exception()
+        raise
+
+    # A deletion that failed fails the build.
+    for f in cleanups:
+        if f is not None:
+            f.result()
 
     print(
         f"\nPublished {build.course_info.name}, "
@@ -2581,7 +2815,7 @@ def get_sources_and_targets(build: BuildData) -> Sequence[UploadDownloadMapping]
         template_data2[TARGET_EXTENSION] = ext
         p = path.normpath(
             leading_slashes.sub(
-                "", VariableSubstituter(nb.dest).safe_substitute(template_data2)
+                "", variable_substituter(nb.dest).safe_substitute(template_data2)
             )
         )
 
@@ -2757,7 +2991,14 @@ def download_notebooks(
 
                     print(f'"{remote}" -> {local}')
                     # Make sure there's a newline at the end of each file.
-                    move(remote, local, ensure_final_newline=True)
+                    # The exported file's stats are those of a temporary
+                    # file, so there's no point in copying them.
+                    move(
+                        remote,
+                        local,
+                        ensure_final_newline=True,
+                        preserve_metadata=False,
+                    )
                     # Remove any others, so they're not treated as leftovers.
                     for r in mapping.remote_targets[1:]:
                         if path.exists(r):
@@ -10,18 +10,23 @@ from abc import ABC, abstractmethod
 import re
 import os
 import contextlib
+import functools
+import hashlib
 import markdown2
 import shutil
-import codecs
+import stat
 import sys
+import threading
 from parsimonious.grammar import Grammar
 from parsimonious import grammar, expressions
-from parsimonious.exceptions import ParseError, VisitationError
+from parsimonious.exceptions import ParseError
+from parsimonious.nodes import Node, RegexNode
 from textwrap import TextWrapper
 import mimetypes
+from collections.abc import Iterable as AbcIterable
 from string import Template
 from tempfile import TemporaryDirectory
-from db_edu_util import all_pred, EnhancedTextWrapper
+from db_edu_util import all_pred, EnhancedTextWrapper, warn
 
 from typing import (
     Sequence,
@@ -38,6 +43,7 @@ from typing import (
     Iterable,
     Callable,
     Type,
+    List,
     no_type_check,
 )
 
@@ -69,6 +75,7 @@ __all__ = [
     "DefaultStrMixin",
     "VariableSubstituter",
     "VariableSubstituterParseError",
+    "variable_substituter",
 ]
 
 # ---------------------------------------------------------------------------
@@ -131,6 +138,55 @@ h4 {
 WARNING_PREFIX = "*** WARNING: "
 DEBUG_PREFIX = "(DEBUG) "
 
+# The strings bool_value() accepts (case-blind), and their values.
+_BOOL_STRINGS = {
+    "t": True,
+    "true": True,
+    "1": True,
+    "yes": True,
+    "f": False,
+    "false": False,
+    "0": False,
+    "no": False,
+}
+
+# A well-formed version string: <major>.<minor>[.<patch>][-<qualifier>].
+# parse_version_string() falls back to its slower path (which produces the
+# error messages) for anything that doesn't match.
+_VERSION_RE = re.compile(r"(\d+)\.(\d+)(?:\.\d+)?(?:-[^-.]*)?")
+
+# The default HTML template, converted once to a str.format() template (with
+# any literal braces escaped), and the Markdown extensions, so they're not
+# rebuilt on every markdown_to_html() call.
+_DEFAULT_HTML_FORMAT = Template(
+    DEFAULT_HTML_TEMPLATE.replace("{", "{{").replace("}", "}}")
+).substitute(title="{title}", css="{css}", body="{body}")
+_MARKDOWN_EXTRAS = ("fenced-code-blocks", "tables", "header-ids")
+
+# The default HTML format, split around the body, so markdown_to_html() can
+# write the converted body directly, without first building the whole page.
+(_DEFAULT_HTML_HEAD_FORMAT, _DEFAULT_HTML_TAIL_FORMAT) = _DEFAULT_HTML_FORMAT.split(
+    "{body}"
+)
+
+# markdown_to_pdf() can cache rendered PDFs, keyed by a hash of the HTML they
+# were rendered from, in a private, per-user directory (see _pdf_cache_dir()).
+# The key doesn't cover files the HTML refers to (images, linked stylesheets,
+# fonts), so the cache is off unless BDC_PDF_CACHE is set to a non-empty
+# value. BDC_NO_PDF_CACHE, if set to a non-empty value, overrides it. The
+# least recently used PDFs are removed once the cache exceeds the size limit.
+_PDF_CACHE_ENABLE_VAR = "BDC_PDF_CACHE"
+_PDF_CACHE_DISABLE_VAR = "BDC_NO_PDF_CACHE"
+_PDF_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Per-thread, reusable Markdown converters. See _markdown_converter().
+_markdown_converters = threading.local()
+
+# Serializes PDF generation. warnings.catch_warnings() modifies global
+# interpreter state, and WeasyPrint makes no thread-safety guarantees, so
+# html_to_pdf() must not run in more than one thread at a time.
+_PDF_LOCK = threading.Lock()
+
 # ---------------------------------------------------------------------------
 # Module globals
 # ---------------------------------------------------------------------------
@@ -165,15 +221,19 @@ def read_yaml_file(path: str, encoding: str = "utf-8") -> Dict[str, Any]:
 
     :return: the loaded YAML file
     """
-    from io import StringIO
     from grizzled.file.includer import Includer
     import yaml
 
-    inc = Includer(source=path, include_regex=r'#include\s+"([^"]+)"', encoding="utf-8")
-    input = StringIO("".join([line for line in inc]))
-    return yaml.safe_load(input)
+    # Use the libyaml-based loader, if PyYAML was built with it. It's
+    # considerably faster than the pure Python one.
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    inc = Includer(
+        source=path, include_regex=r'#include\s+"([^"]+)"', encoding=encoding
+    )
+    return yaml.load("".join(inc), Loader=loader)
 
 
+@functools.lru_cache(maxsize=256)
 def parse_version_string(version: str) -> Tuple[int, int]:
     """
     Parse a semantic version string (e.g., 1.10.30) or a partial
@@ -185,6 +245,10 @@ def parse_version_string(version: str) -> Tuple[int, int]:
 
     :return:  A `(major, minor)` tuple of ints.
     """
+    m = _VERSION_RE.fullmatch(version)
+    if m:
+        return (int(m.group(1)), int(m.group(2)))
+
     nums = version.split(".")
     if len(nums) not in (2, 3):
         raise ValueError(f'"{version}" is a malformed version string')
@@ -214,20 +278,23 @@ def flatten(it: Iterable[Any]) -> Generator[Any, Any, None]:
     # must be handled specially.
     if type(it) is str:
         yield it
-
-    else:
-        for i in it:
-            if type(i) is str:
-                yield i
-                continue
-
-            try:
-                # Is this thing iterable?
-                for j in flatten(iter(i)):
-                    yield j
-            except TypeError:
-                # No. Just yield it as is.
-                yield i
+        return
+
+    # Walk the nested iterables with an explicit stack of iterators, rather
+    # than recursing, so that each level of nesting doesn't cost a generator
+    # frame for every element that passes through it.
+    stack = [iter(it)]
+    while stack:
+        for i in stack[-1]:
+            if type(i) is not str and isinstance(i, AbcIterable):
+                # Descend into the nested iterable. When it's exhausted,
+                # we'll resume where we left off in this one.
+                stack.append(iter(i))
+                break
+
+            yield i
+        else:
+            stack.pop()
 
 
 def merge_dicts(
@@ -244,8 +311,7 @@ def merge_dicts(
     :return: The merged dictionary. Keys in dict2 overwrite duplicate keys in
              dict1
     """
-    res = dict1.copy()
-    res.update(dict2)
+    res = {**dict1, **dict2}
     for d in dicts:
         res.update(d)
     return res
@@ -264,15 +330,12 @@ def bool_value(s: Union[str, int]) -> bool:
         return s
 
     if isinstance(s, int):
-        return False if s == 0 else True
+        return s != 0
 
-    sl = s.lower()
-    if sl in ("t", "true", "1", "yes"):
-        return True
-    elif sl in ("f", "false", "0", "no"):
-        return False
-    else:
+    res = _BOOL_STRINGS.get(s.lower())
+    if res is None:
         raise ValueError(f'Bad boolean value: "{s}"')
+    return res
 
 
 def bool_field(d: Dict[str, Any], key: str, default: bool = False) -> bool:
@@ -297,13 +360,10 @@ def find_in_path(command: str) -> str:
     :param command:  the command to find
     :return: the location. Throws an exception otherwise.
     """
-    path = [p for p in os.getenv("PATH", "").split(os.pathsep) if len(p) > 0]
-    for d in path:
-        p = os.path.join(d, command)
-        if os.path.isfile(p) and os.access(p, os.X_OK):
-            return p
-    else:
+    p = shutil.which(command)
+    if p is None:
         raise Exception(f"""Can't find "{command}" in PATH.""")
+    return p
 
 
 def ensure_parent_dir_exists(path: str) -> NoReturn:
@@ -316,7 +376,11 @@ def ensure_parent_dir_exists(path: str) -> NoReturn:
 
 
 def move(
-    src: str, dest: str, ensure_final_newline: bool = False, encoding: str = "UTF-8"
+    src: str,
+    dest: str,
+    ensure_final_newline: bool = False,
+    encoding: str = "UTF-8",
+    preserve_metadata: bool = True,
 ) -> NoReturn:
     """
     Copy a source file to a destination file, honoring the --verbose
@@ -330,9 +394,35 @@ def move(
                                  file exactly as is, byte for byte.
     :param encoding              Only used if ensure_file_newline is True.
                                  Defaults to 'UTF-8'.
+    :param preserve_metadata     if the file has to be copied, whether to
+                                 copy its mode and timestamps, too. (A
+                                 renamed file always keeps them.)
+
+    A file that doesn't need a final newline is simply renamed, unless src
+    and dest are on different file systems. Then it's copied and deleted.
+
     :return: None
     """
-    _do_copy(src, dest, ensure_final_newline=ensure_final_newline, encoding=encoding)
+    if not ensure_final_newline:
+        # If the file doesn't have to change, try a simple rename first. It
+        # fails if, for instance, the source and destination are on different
+        # file systems, in which case we fall back to copy-and-delete. Unlike
+        # os.rename(), os.replace() also overwrites an existing destination on
+        # Windows, which the copy would do anyway.
+        ensure_parent_dir_exists(os.path.abspath(dest))
+        try:
+            os.replace(src, dest)
+            return
+        except OSError:
+            pass
+
+    _do_copy(
+        src,
+        dest,
+        ensure_final_newline=ensure_final_newline,
+        encoding=encoding,
+        preserve_metadata=preserve_metadata,
+    )
     os.unlink(src)
 
 
@@ -352,17 +442,18 @@ def rm_rf(path: str) -> NoReturn:
     """
     Equivalent of "rm -rf dir", this function is similar to
     shutil.rmtree(dir), except that it doesn't abort if the directory does
-    not exist. It also silently handles regular files. This function throws
-    an OSError if the passed file is neither a regular file nor a directory.
+    not exist. It also silently handles regular files and symbolic links
+    (which are removed, not followed). This function throws an OSError if
+    the passed file is neither a regular file nor a directory.
 
     :param path: The directory or file to (recursively) remove, if it
                         exists.
     """
-    if os.path.exists(path):
-        if os.path.isfile(path):
+    if os.path.lexists(path):
+        if os.path.islink(path) or os.path.isfile(path):
             os.unlink(path)
         elif os.path.isdir(path):
-            shutil.rmtree(path)
+            _rmtree(path)
         else:
             raise OSError(f'"{path}" is neither a file nor a directory')
 
@@ -370,17 +461,22 @@ def rm_rf(path: str) -> NoReturn:
 def mkdirp(dir: str) -> NoReturn:
     """
     Equivalent of "mkdir -p". This function is just a front-end to
-    `os.makedirs()`, but it doesn't abort if the directory already exists.
+    `os.makedirs()`, but it doesn't abort if the directory already exists
+    (even if another thread creates it concurrently).
 
     :param dir: The directory to be created, along with any intervening
                 parent directories that don't exist.
     """
-    if not os.path.exists(dir):
-        os.makedirs(dir)
+    if not os.path.isdir(dir):
+        os.makedirs(dir, exist_ok=True)
 
 
 def copy(
-    src: str, dest: str, ensure_final_newline: bool = False, encoding: str = "UTF-8"
+    src: str,
+    dest: str,
+    ensure_final_newline: bool = False,
+    encoding: str = "UTF-8",
+    preserve_metadata: bool = True,
 ) -> NoReturn:
     """
     Copy a source file to a destination file, honoring the --verbose
@@ -394,9 +490,19 @@ def copy(
                                  file exactly as is, byte for byte.
     :param encoding              Only used if ensure_file_newline is True.
                                  Defaults to 'UTF-8'.
+    :param preserve_metadata     if True (the default), copy the source
+                                 file's mode bits and timestamps to the
+                                 destination. Pass False for transient files
+                                 whose metadata nobody will look at.
     :return: None
     """
-    _do_copy(src, dest, ensure_final_newline=ensure_final_newline, encoding=encoding)
+    _do_copy(
+        src,
+        dest,
+        ensure_final_newline=ensure_final_newline,
+        encoding=encoding,
+        preserve_metadata=preserve_metadata,
+    )
 
 
 def has_extension(path: str) -> bool:
@@ -425,10 +531,10 @@ def is_text_file(path: str) -> bool:
     if is_html(path) or is_markdown(path):
         is_text = True
     else:
-        (mime_type, _) = mimetypes.guess_type(path)
+        mime_type = _guess_mime_type(path)
 
         if (mime_type is not None) and ("/" in mime_type):
-            (major, _) = os.path.splitext(path)
+            (major, _) = mime_type.split("/", 1)
             is_text = major == "text"
     return is_text
 
@@ -442,8 +548,7 @@ def is_pdf(path: str) -> bool:
 
     :return: True or False
     """
-    (mime_type, _) = mimetypes.guess_type(path)
-    return mime_type == "application/pdf"
+    return _guess_mime_type(path) == "application/pdf"
 
 
 def is_html(path: str) -> bool:
@@ -454,10 +559,7 @@ def is_html(path: str) -> bool:
 
     :return: True or False
     """
-    import mimetypes
-
-    (mime_type, _) = mimetypes.guess_type(path)
-    return mime_type in ("application/xhtml+xml", "text/html")
+    return _guess_mime_type(path) in ("application/xhtml+xml", "text/html")
 
 
 def is_markdown(path: str) -> bool:
@@ -489,25 +591,40 @@ def markdown_to_html(
     :param stylesheet     A string containing a stylesheet to inline, or None
                           to use the default
     """
-    with codecs.open(markdown, mode="r", encoding="UTF-8") as input:
+    with open(markdown, mode="r", encoding="UTF-8", newline="") as input:
         text = input.read()
-        body = markdown2.markdown(
-            text, extras=["fenced-code-blocks", "tables", "header-ids"]
-        )
+        body = _markdown_converter().convert(text)
         if stylesheet is None:
             stylesheet = DEFAULT_CSS
 
+        fields = {"title": os.path.basename(markdown), "css": stylesheet}
         if html_template is None:
-            html_template = DEFAULT_HTML_TEMPLATE
+            pieces = (
+                _DEFAULT_HTML_HEAD_FORMAT.format(**fields),
+                body,
+                _DEFAULT_HTML_TAIL_FORMAT.format(**fields),
+            )
+        else:
+            pieces = (Template(html_template).substitute(fields, body=body),)
 
-        template = Template(html_template)
+        with open(html_out, mode="w", encoding="UTF-8", newline="") as output:
+            output.writelines(pieces)
 
-        with codecs.open(html_out, mode="w", encoding="UTF-8") as output:
-            output.write(
-                template.substitute(
-                    body=body, title=os.path.basename(markdown), css=stylesheet
-                )
-            )
+
+def _markdown_converter() -> markdown2.Markdown:
+    """
+    Get this thread's Markdown converter, creating it if necessary. Creating
+    a converter (which processes the extras) is relatively expensive, and a
+    converter resets itself at the start of each conversion, so it can be
+    reused. It can't be shared across threads, though.
+
+    :return: the converter
+    """
+    converter = getattr(_markdown_converters, "converter", None)
+    if converter is None:
+        converter = markdown2.Markdown(extras=list(_MARKDOWN_EXTRAS))
+        _markdown_converters.converter = converter
+    return converter
 
 
 def html_to_pdf(html: str, pdf_out: str) -> NoReturn:
@@ -521,7 +638,7 @@ def html_to_pdf(html: str, pdf_out: str) -> NoReturn:
 
     # Ignore user warnings emitted by the WeasyPrint package.
     # See https://docs.python.org/3/library/warnings.html#temporarily-suppressing-warnings
-    with warnings.catch_warnings():
+    with _PDF_LOCK, warnings.catch_warnings():
         warnings.simplefilter("ignore")
         from weasyprint import HTML
 
@@ -549,7 +666,164 @@ def markdown_to_pdf(
     with TemporaryDirectory() as tempdir:
         html = os.path.join(tempdir, "out.html")
         markdown_to_html(markdown, html, html_template, stylesheet)
+
+        # Rendering the PDF is, by far, the most expensive step, and the
+        # Markdown rarely changes between builds. The generated HTML captures
+        # the Markdown, the template and the stylesheet, so it (along with
+        # the WeasyPrint version) makes a good cache key, as long as nothing
+        # it refers to changes. That's why the cache must be enabled.
+        cache_dir = _pdf_cache_dir()
+        if cache_dir is None:
+            html_to_pdf(html, pdf_out)
+            return
+
+        cache_path = _pdf_cache_path(cache_dir, html)
+        if os.path.exists(cache_path):
+            _copy_file_data(cache_path, pdf_out)
+            with contextlib.suppress(OSError):
+                # Mark it as recently used, for _prune_pdf_cache().
+                os.utime(cache_path)
+            return
+
         html_to_pdf(html, pdf_out)
+        _add_to_pdf_cache(pdf_out, cache_path)
+
+
+def _pdf_cache_dir() -> Optional[str]:
+    """
+    Get the directory in which markdown_to_pdf() caches PDFs, creating it if
+    necessary. The cache is private to the user: it lives under
+    $XDG_CACHE_HOME (or ~/.cache), is kept at mode 0700, and isn't used if
+    it's a symbolic link or is owned by another user. Cached PDFs are copied
+    into builds as is, so nobody else may be able to plant them.
+
+    :return: the cache directory, or None if the cache is disabled or can't
+             be used
+    """
+    if os.environ.get(_PDF_CACHE_DISABLE_VAR) or not os.environ.get(
+        _PDF_CACHE_ENABLE_VAR
+    ):
+        return None
+
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return _checked_pdf_cache_dir(os.path.join(cache_home, "bdc", "pdf"))
+
+
+@functools.lru_cache(maxsize=8)
+def _checked_pdf_cache_dir(cache_dir: str) -> Optional[str]:
+    """
+    Create the PDF cache directory, if necessary, and verify that it's safe
+    to use. The result is cached, so any warning is issued only once.
+
+    :param cache_dir: the cache directory
+
+    :return: cache_dir, or None if it can't be used
+    """
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        st = os.lstat(cache_dir)
+    except OSError as e:
+        warn(f'Not caching PDFs: Can\'t create "{cache_dir}": {e}')
+        return None
+
+    if not stat.S_ISDIR(st.st_mode):
+        warn(f'Not caching PDFs: "{cache_dir}" is not a directory.')
+        return None
+
+    if hasattr(os, "getuid"):
+        if st.st_uid != os.getuid():
+            warn(f'Not caching PDFs: "{cache_dir}" is owned by another user.')
+            return None
+
+        if st.st_mode & 0o077:
+            try:
+                os.chmod(cache_dir, 0o700)
+            except OSError as e:
+                warn(f'Not caching PDFs: Can\'t make "{cache_dir}" private: {e}')
+                return None
+
+    return cache_dir
+
+
+def _pdf_cache_path(cache_dir: str, html: str) -> str:
+    """
+    Get the path of the cached PDF for an HTML file rendered by
+    markdown_to_pdf(). The cached file need not exist.
+
+    :param cache_dir: the cache directory, from _pdf_cache_dir()
+    :param html:      the path to the HTML file
+
+    :return: the path in the cache
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(_weasyprint_version().encode("utf-8"))
+    h.update(b"\0")
+    with open(html, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    return os.path.join(cache_dir, f"{h.hexdigest()}.pdf")
+
+
+def _add_to_pdf_cache(pdf: str, cache_path: str) -> NoReturn:
+    """
+    Save a copy of a rendered PDF in the cache. Since the cache is just an
+    optimization, failures are ignored.
+
+    :param pdf:        the rendered PDF
+    :param cache_path: its path in the cache, from _pdf_cache_path()
+    """
+    try:
+        # Copy to a temporary name and rename, so that a concurrent build
+        # never sees a partially written PDF.
+        temp = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        _copy_file_data(pdf, temp)
+        os.replace(temp, cache_path)
+        _prune_pdf_cache(os.path.dirname(cache_path), _PDF_CACHE_MAX_BYTES)
+    except OSError:
+        pass
+
+
+def _prune_pdf_cache(cache_dir: str, max_bytes: int) -> NoReturn:
+    """
+    Remove the least recently used PDFs from the cache until its total size
+    is no more than max_bytes.
+
+    :param cache_dir: the cache directory
+    :param max_bytes: the maximum total size of the cached PDFs
+
+    :raise OSError: on error
+    """
+    with os.scandir(cache_dir) as it:
+        entries = [
+            (e.stat().st_mtime, e.stat().st_size, e.path)
+            for e in it
+            if e.name.endswith(".pdf") and e.is_file(follow_symlinks=False)
+        ]
+
+    total = sum(size for (_, size, _) in entries)
+    if total <= max_bytes:
+        return
+
+    for (_, size, path) in sorted(entries):
+        with contextlib.suppress(FileNotFoundError):
+            # A concurrent build may have removed it already.
+            os.unlink(path)
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+@functools.lru_cache(maxsize=1)
+def _weasyprint_version() -> str:
+    import warnings
+
+    with _PDF_LOCK, warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        import weasyprint
+
+    return getattr(weasyprint, "__version__", "")
 
 
 def dict_get_and_del(d: Dict[str, Any], key: str, default: Optional[Any] = None) -> Any:
@@ -562,14 +836,10 @@ def dict_get_and_del(d: Dict[str, Any], key: str, default: Optional[Any] = None)
 
     :return: The value, with d possibly modified
     """
-    if key in d:
-        res = d[key]
-        del d[key]
-        return res
-
-    return default
+    return d.pop(key, default)
 
 
+@functools.lru_cache(maxsize=None)
 def variable_ref_patterns(variable_name: str) -> Sequence[Pattern]:
     """
     Convert a variable name into a series of regular expressions that will
@@ -588,7 +858,9 @@ def variable_ref_patterns(variable_name: str) -> Sequence[Pattern]:
     Group 2 - The variable reference
     Group 3 - The portion of the string those follows the variable reference
 
-    For convenience, use the result with matches_variable_ref().
+    For convenience, use the result with matches_variable_ref(). The result
+    is cached, so calling this function repeatedly with the same variable
+    name is cheap.
 
     :param variable_name: the variable name
 
@@ -649,15 +921,14 @@ class DefaultStrMixin(ABC):
     """
 
     def __str__(self):
-        indent = " " * (len(self.__class__.__name__) + 1)
-        fields = []
-        for key in sorted(self.__dict__.keys()):
-            value = self.__dict__[key]
-            v = f'"{value}"' if isinstance(value, str) else value
-            fields.append(f"{key}={v}")
+        class_name = self.__class__.__name__
+        indent = " " * (len(class_name) + 1)
+        fields = [
+            f'{key}="{value}"' if isinstance(value, str) else f"{key}={value}"
+            for key, value in sorted(self.__dict__.items())
+        ]
 
         delim = f",\n{indent}"
-        class_name = self.__class__.__name__
         field_str = delim.join(fields)
         return f"{class_name}({field_str})"
 
@@ -719,10 +990,15 @@ _VAR_SUBST_EDIT_GROUPREF_PREFIX = "$"
 
 
 def _replace_tokens(s: str, tokens: Dict[str, str]) -> str:
-    s2 = s
-    for token, replacement in list(tokens.items()):
-        s2 = s2.replace(token, replacement)
-    return s2
+    # Replace all the tokens in a single pass. Because replacement text is
+    # never rescanned, the result doesn't depend on the order of the tokens.
+    # Longer tokens are tried first, so a token that's a prefix of another
+    # one can't shadow it.
+    if not tokens:
+        return s
+    alternatives = sorted(tokens, key=len, reverse=True)
+    pattern = re.compile("|".join(re.escape(t) for t in alternatives))
+    return pattern.sub(lambda m: tokens[m.group(0)], s)
 
 
 # The grammar itself. Some values are substituted, so they can be shared
@@ -887,6 +1163,59 @@ OPT_WS                = ~"\s*"
 
 # print(_VAR_SUBST_GRAMMAR);import sys;sys.exit(1)
 
+# Compiling the grammar is far more expensive than parsing a typical template,
+# so do it once, here, rather than in every VariableSubstituter.
+_VAR_SUBST_COMPILED_GRAMMAR = Grammar(_VAR_SUBST_GRAMMAR)
+
+# A backslash escape in template text, and the characters that a backslash
+# actually escapes. Any other backslash is kept as is.
+_VAR_SUBST_ESCAPE_RE = re.compile(r"\\(.?)", re.S)
+_VAR_SUBST_ESCAPABLE = frozenset({_VAR_SUBST_VAR_PREFIX, "\\", '"'})
+
+# Escaped delimiters and group reference prefixes in an edit's replacement
+# text, by delimiter.
+_VAR_SUBST_EDIT_UNESCAPE_RE = {
+    delim: re.compile(
+        r"\\("
+        + re.escape(delim)
+        + "|"
+        + re.escape(_VAR_SUBST_EDIT_GROUPREF_PREFIX)
+        + ")"
+    )
+    for delim in (_VAR_SUBST_EDIT_DELIM1, _VAR_SUBST_EDIT_DELIM2)
+}
+
+# Bounds on the per-_Edit results cache.
+_EDIT_CACHE_SIZE = 256
+_EDIT_CACHE_MAX_VALUE_LENGTH = 4096
+
+# Most templates consist of nothing but text, "$$" escapes, and plain $var
+# and ${var} references (no subscripts, ternaries or edits). Those can be
+# tokenized with a couple of regular expressions, which is far cheaper than
+# running the PEG parser. Anything else (including anything with a quote or
+# a backslash) goes to the parser. Only ASCII templates qualify: the
+# grammar's case-blind identifier pattern also matches a few non-ASCII
+# letters (e.g., "\u0131" and the Kelvin sign), and its idea of which ones
+# differs from the re module's. The lookahead keeps a failed match from
+# backtracking into the identifiers.
+_VAR_SUBST_SIMPLE_TEMPLATE_RE = re.compile(
+    r'(?:[^$"\\]|\$\$|\$\{[A-Za-z0-9_]+\}|\$[A-Za-z0-9_]+(?![A-Za-z0-9_]))*'
+)
+_VAR_SUBST_SIMPLE_TOKEN_RE = re.compile(
+    r"\$\$|\$\{([A-Za-z0-9_]+)\}|\$([A-Za-z0-9_]+)"
+)
+
+# Parsimonious node types, all of which have an "expr" field.
+_EXPR_NODE_TYPES = frozenset({Node, RegexNode})
+
+# Parsed _Edit tokens, by edit expression text, and a bound on their number.
+_parsed_edits = {}
+_PARSED_EDITS_CACHE_SIZE = 512
+
+# Characters that make a template more than literal text. A template without
+# any of them substitutes to itself. (They're the escapable characters.)
+_VAR_SUBST_SPECIAL_CHARS = _VAR_SUBST_ESCAPABLE
+
 
 class VariableSubstituterParseError(Exception):
     pass
@@ -916,38 +1245,48 @@ class VariableSubstituter(object):
         :param template: The template containing variables to substitute.
         """
         self._template = template
+        if not _VAR_SUBST_SPECIAL_CHARS.intersection(template):
+            # Nothing to substitute or unescape, so there's no point in
+            # running the parser. (A template like this can't fail to parse.)
+            self._set_tokens([_Text(template)] if template else [])
+            return
+
+        if template.isascii() and _VAR_SUBST_SIMPLE_TEMPLATE_RE.fullmatch(template):
+            self._set_tokens(_coalesce_text(_simple_template_tokens(template)))
+            return
+
         try:
-            self._grammar = Grammar(_VAR_SUBST_GRAMMAR)
-            parsimonious_ast = self._grammar.parse(template)
-            visitor = _VarSubstASTVisitor()
-            self._tokens = list(flatten(visitor.visit(parsimonious_ast)))
+            parsimonious_ast = _VAR_SUBST_COMPILED_GRAMMAR.parse(template)
+            self._set_tokens(
+                _coalesce_text(_VAR_SUBST_VISITOR.tokens(parsimonious_ast))
+            )
 
         except ParseError as e:
             raise VariableSubstituterParseError(
                 f'Failed to parse "{self.template}": {e}'
             )
 
-        except VisitationError as e:
-            # This is ugly and would not be necessary if VisitationError
-            # contained the original thrown exception. The visitor in this
-            # package can throw validation exceptions, which the caller
-            # should see as is, without all the Parsimonious parse tree data
-            # (which isn't helpful to the caller, since we're hiding it in
-            # here).
-            #
-            # Since we can't actually test the nested exception, we have to
-            # check the text of the message.
-            pat = re.compile(r"^.*VariableSubstituterParseError: (.*)\s*Parse tree:")
-            msg = str(e).replace("\n", " ")
-            m = pat.search(msg)
-            if m:
-                raise VariableSubstituterParseError(
-                    f'Failed to parse "{self.template}: {m.group(1)}'
-                )
-            else:
-                raise VariableSubstituterParseError(
-                    f'Failed to parse "{self.template}"'
-                )
+        except VariableSubstituterParseError as e:
+            # Validation errors from the visitor. tokens(), unlike visit(),
+            # doesn't wrap these in a VisitationError.
+            raise VariableSubstituterParseError(
+                f'Failed to parse "{self.template}: {e}'
+            )
+
+    def _set_tokens(self, tokens: List[_Token]) -> NoReturn:
+        """
+        Save the template's tokens, along with everything that can be
+        precomputed from them.
+
+        :param tokens: the tokens
+        """
+        self._tokens = tokens
+        # If the template only contains (escaped) text, its expansion never
+        # changes, so compute it now.
+        self._constant = _constant_text(tokens)
+        # What each token contributes to the result: literal text as is, or
+        # the (bound) method that evaluates the token.
+        self._parts = [t.text if t.__class__ is _Text else t.evaluate for t in tokens]
 
     @property
     def template(self) -> str:
@@ -971,7 +1310,8 @@ class VariableSubstituter(object):
         """
 
         def get_var(varname):
-            return str(variables[varname])
+            v = variables[varname]
+            return v if v.__class__ is str else str(v)
 
         return self._subst(get_var)
 
@@ -998,34 +1338,71 @@ class VariableSubstituter(object):
         """
 
         def get_var(varname):
-            return str(variables.get(varname, ""))
+            v = variables.get(varname, "")
+            return v if v.__class__ is str else str(v)
 
         return self._subst(get_var)
 
-    def _subst(self, get_var: Callable[[str], Any]) -> str:
+    def substitute_many(self, variables_list: Iterable[Dict[str, Any]]) -> List[str]:
+        """
+        Substitute the template once for each of a series of variable
+        dictionaries. The result is the same as calling `substitute()` with
+        each dictionary in turn, but the template's tokens are walked only
+        once for the whole batch. As with `substitute()`, a `KeyError` is
+        thrown for any variable reference that isn't in a dictionary.
+
+        :param variables_list: The variable dictionaries
+
+        :return: The substituted strings, in the same order as the dictionaries
+        """
+
+        def make_get_var(variables):
+            def get_var(varname):
+                v = variables[varname]
+                return v if v.__class__ is str else str(v)
+
+            return get_var
+
+        getters = [make_get_var(variables) for variables in variables_list]
+        if self._constant is not None:
+            return [self._constant] * len(getters)
+
+        columns = [
+            [p] * len(getters)
+            if p.__class__ is str
+            else [p(get_var) for get_var in getters]
+            for p in self._parts
+        ]
+        return ["".join(pieces) for pieces in zip(*columns)]
+
+    def _subst(self, get_var: Callable[[str], str]) -> str:
         """
         Workhorse method for both substitute() and safe_substitute().
 
-        :param get_var:  function to call to retrieve a variable's value
+        :param get_var:  function to call to retrieve a variable's value, as
+                         a string
 
         :return: The substituted string
         """
+        if self._constant is not None:
+            return self._constant
 
-        def handle_token(token):
-            if type(token) is _Var:
-                result = token.evaluate(get_var(token.name))
-            elif type(token) == _Text:
-                result = token.text
-            elif type(token) == _Ternary:
-                result = token.evaluate(get_var)
-            elif type(token) == _Edit:
-                result = token.evaluate(get_var)
-            else:
-                raise KeyError(f"(BUG) Unknown token: {token}")
+        return "".join([p if p.__class__ is str else p(get_var) for p in self._parts])
 
-            return result
 
-        return "".join([t.evaluate(get_var) for t in self._tokens])
+@functools.lru_cache(maxsize=1024)
+def variable_substituter(template: str) -> VariableSubstituter:
+    """
+    Get a `VariableSubstituter` for a template, reusing a previously parsed
+    one if the same template has been seen before. Substituters are immutable
+    once constructed, so sharing them is safe.
+
+    :param template: The template containing variables to substitute.
+
+    :return: the `VariableSubstituter`
+    :raise VariableSubstituterParseError: if the template can't be parsed
+    """
+    return VariableSubstituter(template)
 
 
 class _Token(DefaultStrMixin):
@@ -1036,7 +1413,7 @@ class _Token(DefaultStrMixin):
     """
 
     @abstractmethod
-    def evaluate(self, get_var: Callable[[str], Any]) -> str:
+    def evaluate(self, get_var: Callable[[str], str]) -> str:
         """
         Evaluate the token, returning the resulting string.
 
@@ -1046,12 +1423,24 @@ class _Token(DefaultStrMixin):
         """
         pass
 
-    def _expand(
-        self,
-        get_var: Callable[[str], Any],
-        tokens: Sequence[Type[_Token]],
-        allowed_tokens: Set[Type[_Token]],
-    ) -> str:
+    @staticmethod
+    def _allowed(
+        tokens: Sequence[_Token], allowed_tokens: Set[Type[_Token]]
+    ) -> List[_Token]:
+        """
+        Filter a list of tokens down to the allowed token classes. Tokens with
+        nested token lists do this once, at construction, so that _expand()
+        doesn't have to check every token on every evaluation.
+
+        :param tokens:         the list of tokens
+        :param allowed_tokens: the set of allowed token classes; any others are
+                               dropped
+
+        :return: the allowed tokens
+        """
+        return [t for t in tokens if t.__class__ in allowed_tokens]
+
+    def _expand(self, get_var: Callable[[str], str], tokens: Sequence[_Token]) -> str:
         """
         Expands a list of tokens, processing each one by calling its
         evaluate() method.
@@ -1059,13 +1448,14 @@ class _Token(DefaultStrMixin):
         :param get_var         a function that will retrieve the value of a
                                variable
         :param tokens:         the list of tokens
-        :param allowed_tokens: the set of allowed token classes; any others are
-                               ignored
 
         :return: the resulting string
         """
         return "".join(
-            [t.evaluate(get_var) for t in tokens if t.__class__ in allowed_tokens]
+            [
+                t.text if t.__class__ is _Text else t.evaluate(get_var)
+                for t in tokens
+            ]
         )
 
 
@@ -1088,11 +1478,15 @@ class _Var(_Token):
         :param slice_end:   ending subscript, if any. None if not.
         """
         super(_Var, self).__init__()
-        self.name = name
+        # Interned, since it's looked up in the variables dict on every
+        # evaluation.
+        self.name = sys.intern(name)
         self.slice_start = slice_start
         self.slice_end = slice_end
+        # Build the slice once, rather than on every evaluation.
+        self._slice = None if slice_end is None else slice(slice_start, slice_end)
 
-    def evaluate(self, get_var: Callable[[str], Any]) -> str:
+    def evaluate(self, get_var: Callable[[str], str]) -> str:
         """
         Evaluate the variable's value, applying any subscripts.
 
@@ -1100,7 +1494,7 @@ class _Var(_Token):
 
         :return: the possibly-sliced value
         """
-        v = str(get_var(self.name))
+        v = get_var(self.name)
         if len(v) == 0:
             return ""
 
@@ -1111,8 +1505,8 @@ class _Var(_Token):
             i = len(v) - 1 if self.slice_start > len(v) else self.slice_start
             return v[i]
 
-        end = len(v) if self.slice_end > len(v) else self.slice_end
-        return v[self.slice_start : end]
+        # Slicing already clamps out-of-range bounds.
+        return v[self._slice]
 
 
 class _Text(_Token):
@@ -1129,7 +1523,7 @@ class _Text(_Token):
         super(_Text, self).__init__()
         self.text = text
 
-    def evaluate(self, get_var: Callable[[str], Any]) -> str:
+    def evaluate(self, get_var: Callable[[str], str]) -> str:
         """
         Evaluate the token. In this case, just return the text
 
@@ -1140,6 +1534,67 @@ class _Text(_Token):
         return self.text
 
 
+def _coalesce_text(tokens: Iterable[_Token]) -> List[_Token]:
+    """
+    Merge runs of adjacent `_Text` tokens into single tokens, dropping any
+    empty ones. The visitor produces lots of these (edit replacements, for
+    instance, yield one per character), and evaluating each one separately
+    is wasted work.
+
+    :param tokens: the tokens
+
+    :return: the coalesced list of tokens
+    """
+    result = []
+    for token in tokens:
+        if type(token) is _Text:
+            if not token.text:
+                continue
+            if result and type(result[-1]) is _Text:
+                result[-1] = _Text(result[-1].text + token.text)
+                continue
+        result.append(token)
+    return result
+
+
+def _simple_template_tokens(template: str) -> Generator[_Token, None, None]:
+    """
+    Tokenize a template that matches _VAR_SUBST_SIMPLE_TEMPLATE_RE, producing
+    the same tokens the parser would.
+
+    :param template: the template
+
+    :return: a generator of `_Text` and `_Var` tokens
+    """
+    start = 0
+    for m in _VAR_SUBST_SIMPLE_TOKEN_RE.finditer(template):
+        if m.start() > start:
+            yield _Text(template[start : m.start()])
+        name = m.group(1) or m.group(2)
+        if name:
+            yield _Var(name)
+        else:
+            yield _Text(_VAR_SUBST_VAR_PREFIX)
+        start = m.end()
+
+    if start < len(template):
+        yield _Text(template[start:])
+
+
+def _constant_text(tokens: Sequence[_Token]) -> Optional[str]:
+    """
+    Get the string a list of tokens expands to, if it doesn't depend on
+    any variables.
+
+    :param tokens: the tokens
+
+    :return: the constant string, or None if any token isn't a `_Text`
+    """
+    if all(type(t) is _Text for t in tokens):
+        return "".join(t.text for t in tokens)
+    return None
+
+
 class _Ternary(_Token):
     """
     Captures the pieces of a ternary IF.
@@ -1166,13 +1621,20 @@ class _Ternary(_Token):
                             is false
         """
         super(_Ternary, self).__init__()
-        self.variable = variable
+        self.variable = sys.intern(variable)
         self.op = op
-        self.to_compare = to_compare
-        self.if_true = if_true
-        self.if_false = if_false
-
-    def evaluate(self, get_var: Callable[[str], Any]) -> str:
+        self.to_compare = self._allowed(to_compare, {_Var, _Text})
+        self.if_true = self._allowed(if_true, {_Var, _Text})
+        self.if_false = self._allowed(if_false, {_Var, _Text})
+
+        # Most ternaries compare against, and produce, literal strings. Those
+        # can be computed once, here, rather than on every evaluation.
+        self._const_to_compare = _constant_text(self.to_compare)
+        self._const_if_true = _constant_text(self.if_true)
+        self._const_if_false = _constant_text(self.if_false)
+        self._eq = op == _VAR_SUBST_EQ_OP
+
+    def evaluate(self, get_var: Callable[[str], str]) -> str:
         """
         Evaluate the ternary expression, returning the resulting string.
 
@@ -1181,18 +1643,20 @@ class _Ternary(_Token):
         :return: the resulting string
         """
 
-        to_compare = self._expand(get_var, self.to_compare, {_Var, _Text})
+        to_compare = self._const_to_compare
+        if to_compare is None:
+            to_compare = self._expand(get_var, self.to_compare)
 
-        this_var_value = get_var(self.variable)
-        if self.op == _VAR_SUBST_EQ_OP:
-            test = to_compare == this_var_value
+        # _eq is True for "==" and False for "!=", so this is the outcome of
+        # the comparison either way.
+        if (to_compare == get_var(self.variable)) is self._eq:
+            result, tokens = self._const_if_true, self.if_true
         else:
-            test = to_compare != this_var_value
+            result, tokens = self._const_if_false, self.if_false
 
-        if test is True:
-            return self._expand(get_var, self.if_true, {_Var, _Text})
-        else:
-            return self._expand(get_var, self.if_false, {_Var, _Text})
+        if result is None:
+            result = self._expand(get_var, tokens)
+        return result
 
 
 class _Edit(_Token):
@@ -1213,12 +1677,19 @@ class _Edit(_Token):
         :param replace_all: whether to not to do a global replacement
         """
         super(_Edit, self).__init__()
-        self.variable = variable
+        self.variable = sys.intern(variable)
         self.pattern = pattern
-        self.repl = repl
+        self.repl = self._allowed(repl, {_Var, _Text})
         self.replace_all = replace_all
-
-    def evaluate(self, get_var: Callable[[str], Any]) -> str:
+        # Resolved once, rather than on every evaluation.
+        self._sub = pattern.sub
+        self._count = 0 if replace_all else 1
+        # Results of previous evaluations, keyed by (value, replacement). The
+        # same substituter tends to see the same values over and over (e.g.,
+        # once for the student build and once for the instructor build).
+        self._results = {}
+
+    def evaluate(self, get_var: Callable[[str], str]) -> str:
         """
         Evaluate the edit expression, returning the resulting string.
 
@@ -1226,12 +1697,21 @@ class _Edit(_Token):
                         its value
         :return: the resulting string
         """
-        value = str(get_var(self.variable))
+        value = get_var(self.variable)
 
         # Expand the replacement string.
-        repl = self._expand(get_var, self.repl, {_Var, _Text})
-        count = 0 if self.replace_all else 1
-        return self.pattern.sub(repl, value, count=count)
+        repl = self._expand(get_var, self.repl)
+        key = (value, repl)
+        result = self._results.get(key)
+        if result is None:
+            result = self._sub(repl, value, self._count)
+            if len(value) <= _EDIT_CACHE_MAX_VALUE_LENGTH:
+                # Crude, but thread-safe, bound on the cache size.
+                if len(self._results) >= _EDIT_CACHE_SIZE:
+                    self._results.clear()
+                self._results[key] = result
+
+        return result
 
 
 @no_type_check
@@ -1245,6 +1725,9 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
     SUBSCRIPT_RE = re.compile(r"^subscript$")
     IDENT_RE = re.compile(r"^identifier$")
 
+    # The nodes that translate directly to tokens.
+    TOKEN_NODE_NAMES = {"var1", "var2", "text", "ternary", "edit1", "edit2"}
+
     """
     This visitor translates the parsed Parsimonious AST into something more
     useful to the template substituter.
@@ -1264,6 +1747,29 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
         """
         return visited_children or node
 
+    def tokens(self, node):
+        """
+        Translate an AST into a flat list of tokens. This walks the tree top
+        down and hands each node in TOKEN_NODE_NAMES to its visit method.
+        Unlike visit(), it doesn't first visit the children of those nodes
+        (the visit methods examine the children themselves), and it doesn't
+        build nested lists that then have to be flattened.
+
+        :param node: the root of the AST
+
+        :return: the list of tokens
+        """
+        result = []
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n.expr_name in self.TOKEN_NODE_NAMES:
+                result.append(getattr(self, "visit_" + n.expr_name)(n, []))
+            else:
+                stack.extend(reversed(n.children))
+
+        return result
+
     def visit_var1(self, node, children):
         """
         Called to visit "var1" nodes
@@ -1329,24 +1835,16 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
         """
         # Be sure to unescape stuff.
         def unescape(s):
-            s2 = ""
-            saw_backslash = False
-            for c in s:
-                if saw_backslash:
-                    if c in {_VAR_SUBST_VAR_PREFIX, "\\", '"'}:
-                        s2 += c
-                    else:
-                        s2 += "\\" + c
-                    saw_backslash = False
-                    continue
+            if "\\" not in s:
+                return s
+            return _VAR_SUBST_ESCAPE_RE.sub(unescape_one, s)
 
-                if c == "\\":
-                    saw_backslash = True
-                    continue
-
-                s2 += c
-
-            return s2
+        def unescape_one(m):
+            c = m.group(1)
+            if (not c) or (c in _VAR_SUBST_ESCAPABLE):
+                # A trailing backslash is just dropped.
+                return c
+            return "\\" + c
 
         # Also handle "$$" as a special caswe.
         return _Text(
@@ -1385,7 +1883,7 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
                 elif name == "var2":
                     res.append(self.visit_var2(c, []))
 
-            return res
+            return _coalesce_text(res)
 
         var = None
         to_compare = None
@@ -1465,6 +1963,11 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
 
         :return: an _Edit object
         """
+        # An edit is entirely determined by its text, and _Edit objects are
+        # safe to share, so the same edit in another template can be reused.
+        edit = _parsed_edits.get(node.text)
+        if edit is not None:
+            return edit
 
         def parse_replacement(child):
             # The replacement node is an AST consisting of groupref,
@@ -1482,9 +1985,9 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
                     continue
 
                 if self.NON_DELIM_RE.match(n.expr.name):
-                    s = n.text.replace(backslash_delim, delim).replace(
-                        escaped_group_ref, "$"
-                    )
+                    s = n.text
+                    if "\\" in s:
+                        s = _VAR_SUBST_EDIT_UNESCAPE_RE[delim].sub(r"\1", s)
                     tokens.append(_Text(s))
                     continue
 
@@ -1496,7 +1999,7 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
                     tokens.append(self.visit_var2(n, []))
                     continue
 
-            return tokens
+            return _coalesce_text(tokens)
 
         # Main method logic
 
@@ -1504,10 +2007,10 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
         pattern = None
         repl = ""
         repl_string = None  # original repl string, for errors
+        pattern_text = None  # original pattern string, for errors
         replace_all = False
         flags = 0
         backslash_delim = "\\" + delim
-        escaped_group_ref = "\\$"
         referenced_groups = []
 
         for child in self._child_exprs(node):
@@ -1516,13 +2019,9 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
                 var = child.text
 
             elif expr.name.startswith("pattern"):
-                try:
-                    pattern = child.text.replace(backslash_delim, delim)
-                    re.compile(pattern)
-                except:
-                    raise VariableSubstituterParseError(
-                        f'Bad regular expression "{child.text}" in ' + f'"{node.text}".'
-                    )
+                # Compiled below, once the flags are known.
+                pattern = child.text.replace(backslash_delim, delim)
+                pattern_text = child.text
 
             elif expr.name.startswith("replacement"):
                 repl = parse_replacement(child)
@@ -1550,8 +2049,14 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
                 + f"pattern={pattern}, repl={repl}"
             )
 
-        # Compile the regular expression.
-        pattern = re.compile(pattern, flags=flags)
+        # Compile the regular expression. This is the only place it's
+        # compiled; _Edit.evaluate() uses the compiled pattern directly.
+        try:
+            pattern = _compile_edit_pattern(pattern, flags)
+        except re.error:
+            raise VariableSubstituterParseError(
+                f'Bad regular expression "{pattern_text}" in ' + f'"{node.text}".'
+            )
 
         # Validate the group references.
         total_groups = pattern.groups
@@ -1562,20 +2067,35 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
                 + f'group(s) in "{pattern.pattern}"'
             )
 
-        return _Edit(variable=var, pattern=pattern, repl=repl, replace_all=replace_all)
+        edit = _Edit(variable=var, pattern=pattern, repl=repl, replace_all=replace_all)
+        # Crude, but thread-safe, bound on the cache size.
+        if len(_parsed_edits) >= _PARSED_EDITS_CACHE_SIZE:
+            _parsed_edits.clear()
+        _parsed_edits[node.text] = edit
+        return edit
+
+    @staticmethod
+    def _has_expr(node):
+        """
+        Determine whether a node has an `expr` field. Parsimonious' own node
+        types always do, and a type check is cheaper than hasattr().
+
+        :param node: the node
+
+        :return: True or False
+        """
+        return type(node) in _EXPR_NODE_TYPES or hasattr(node, "expr")
 
     def _child_exprs(self, node):
         """
-        Return a generator of all of a node's immediate child nodes that have
+        Return a list of all of a node's immediate child nodes that have
         an `expr` field.
 
         :param node: the node
 
         :return: the child nodes
         """
-        for child in node:
-            if hasattr(child, "expr"):
-                yield child
+        return [child for child in node.children if self._has_expr(child)]
 
     def _all_descendents(self, node):
         """
@@ -1583,12 +2103,14 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
 
         :param node: the node
 
-        :return: the descendent nodes
+        :return: the descendent nodes, in pre-order
         """
-        for child in node:
+        # Iterative, to avoid a chain of nested generators as deep as the tree.
+        stack = list(reversed(node.children))
+        while stack:
+            child = stack.pop()
             yield child
-            for c in self._all_descendents(child):
-                yield c
+            stack.extend(reversed(child.children))
 
     def _all_descendent_exprs(self, node):
         """
@@ -1600,7 +2122,7 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
         :return: the descendent nodes
         """
         for child in self._all_descendents(node):
-            if hasattr(child, "expr"):
+            if self._has_expr(child):
                 yield child
 
     def _find_recursively(self, node, expr_re):
@@ -1614,22 +2136,196 @@ class _VarSubstASTVisitor(grammar.NodeVisitor):
         :return: the matching nodes
         """
         for child in self._all_descendents(node):
-            try:
-                if expr_re.search(child.expr_name):
-                    return child
-            except AttributeError:
-                continue
+            name = getattr(child, "expr_name", None)
+            # Most nodes are anonymous, so don't bother searching those.
+            if name and expr_re.search(name):
+                return child
 
         return None
 
 
+# The visitor keeps no state between (or during) walks, so one will do.
+_VAR_SUBST_VISITOR = _VarSubstASTVisitor()
+
+
 # ---------------------------------------------------------------------------
 # Module-private functions
 # ---------------------------------------------------------------------------
 
 
+@functools.lru_cache(maxsize=256)
+def _compile_edit_pattern(pattern: str, flags: int) -> Pattern:
+    """
+    Compile the regular expression in a variable substitution edit. Different
+    templates often use the same edits, and a direct cache hit here is cheaper
+    than going through re.compile()'s own cache.
+
+    :param pattern: the regular expression
+    :param flags:   the re flags
+
+    :return: the compiled expression
+    :raise re.error: if the expression is invalid
+    """
+    return re.compile(pattern, flags=flags)
+
+
+def _rmtree(directory: str) -> NoReturn:
+    """
+    Recursively remove a directory. Unlike shutil.rmtree() (at least before
+    Python 3.12), this function relies on the file type information returned
+    by os.scandir(), rather than calling stat() on every entry. Symbolic
+    links are removed, not followed.
+
+    :param directory: the directory to remove
+    """
+    with os.scandir(directory) as it:
+        entries = list(it)
+
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            _rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
+
+    os.rmdir(directory)
+
+
+def _guess_mime_type(path: str) -> Optional[str]:
+    """
+    Guess a file's MIME type from its extension, like
+    `mimetypes.guess_type(path)[0]`, but caching the result by extension.
+
+    :param path: the path to the file
+
+    :return: the MIME type, or None if it can't be determined
+    """
+    (_, ext) = os.path.splitext(path)
+    ext = ext.lower()
+    if (ext in mimetypes.encodings_map) or (ext in mimetypes.suffix_map):
+        # Compound extension (e.g., ".tar.gz"). The result depends on more
+        # than the last extension, so let mimetypes figure it out.
+        (mime_type, _) = mimetypes.guess_type(path)
+        return mime_type
+
+    return _guess_mime_type_for_extension(ext)
+
+
+@functools.lru_cache(maxsize=1024)
+def _guess_mime_type_for_extension(ext: str) -> Optional[str]:
+    (mime_type, _) = mimetypes.guess_type(f"file{ext}")
+    return mime_type
+
+
+# The most data a single copy_file_range() or sendfile() call is asked to copy.
+_KERNEL_COPY_MAX_CHUNK = 2 ** 30
+_KERNEL_COPY_MIN_CHUNK = 8 * 1024 * 1024
+
+
+def _copy_file_data(src: str, dest: str) -> NoReturn:
+    """
+    Copy the contents (only) of one file to another. Where the OS supports
+    it, the data is copied in the kernel: with copy_file_range(2) (which can
+    share blocks on copy-on-write file systems) or, failing that,
+    sendfile(2). (Before Python 3.8, shutil.copyfile() always uses a
+    read/write loop.) Otherwise, this function falls back to an ordinary
+    read/write loop.
+
+    :param src:  the source file
+    :param dest: the destination file, which is created or truncated
+
+    :raise shutil.SameFileError: if src and dest are the same file
+    :raise OSError: on error
+    """
+    kernel_copies = []
+    if hasattr(os, "copy_file_range"):
+        kernel_copies.append(
+            lambda infd, outfd, offset, count: os.copy_file_range(
+                infd, outfd, count, offset, offset
+            )
+        )
+    if hasattr(os, "sendfile"):
+        kernel_copies.append(
+            lambda infd, outfd, offset, count: os.sendfile(outfd, infd, offset, count)
+        )
+
+    # The destination isn't truncated until it's known not to be the source.
+    # Comparing the open files costs no extra path lookups.
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    with open(src, "rb") as s, open(os.open(dest, flags, 0o666), "wb") as d:
+        infd = s.fileno()
+        outfd = d.fileno()
+        in_stat = os.fstat(infd)
+        if os.path.samestat(in_stat, os.fstat(outfd)):
+            raise shutil.SameFileError(f'"{src}" and "{dest}" are the same file.')
+        d.truncate()
+
+        # The size is only a hint: files in /proc, on some FUSE file systems,
+        # or still being written can hold more (or less) than st_size says,
+        # so each copy runs until the kernel reports the end of the file.
+        chunk = min(
+            max(in_stat.st_size, _KERNEL_COPY_MIN_CHUNK), _KERNEL_COPY_MAX_CHUNK
+        )
+        for kernel_copy in kernel_copies:
+            offset = 0
+            try:
+                while True:
+                    copied = kernel_copy(infd, outfd, offset, chunk)
+                    if copied == 0:
+                        break
+                    offset += copied
+            except OSError:
+                # Some platforms (e.g., macOS) only support sendfile() to a
+                # socket, some kernels can't copy_file_range() across file
+                # systems, and some file systems support neither. That's
+                # known from the first call. A later failure is a real error.
+                if offset > 0:
+                    raise
+                continue
+
+            if offset > 0:
+                return
+            # Nothing was copied. Either the file is empty, or (as some file
+            # systems do, rather than failing) the kernel declined to copy
+            # it. Either way, let the next method decide.
+
+        s.seek(0)
+        d.seek(0)
+        d.truncate()
+        shutil.copyfileobj(s, d)
+
+
+def _ensure_final_newline(file: str, encoding: str) -> NoReturn:
+    """
+    Append a newline to a file if it doesn't already end with one. Only the
+    end of the file is read, and nothing is decoded.
+
+    :param file:     the file
+    :param encoding: the file's encoding
+
+    :raise OSError: On error
+    """
+    newline = "\n".encode(encoding)
+    # Some encodings (e.g., UTF-16) emit a BOM at the start of the encoded
+    # text. That's only wanted if the file is empty.
+    bare_newline = "\n\n".encode(encoding)[len(newline) :]
+    with open(file, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            f.write(newline)
+        elif size < len(bare_newline):
+            f.write(bare_newline)
+        else:
+            f.seek(-len(bare_newline), os.SEEK_END)
+            if f.read() != bare_newline:
+                f.write(bare_newline)
+
+
 def _do_copy(
-    src: str, dest: str, ensure_final_newline: bool = False, encoding: str = "UTF-8"
+    src: str,
+    dest: str,
+    ensure_final_newline: bool = False,
+    encoding: str = "UTF-8",
+    preserve_metadata: bool = True,
 ):
     """
     Workhorse function that actually copies a text file. Used by move() and
@@ -1643,27 +2339,27 @@ def _do_copy(
                                    final newline, False to simply copy it as
                                    is
     :param encoding:               the encoding of the source file
+    :param preserve_metadata:      True to copy the source file's stats to
+                                   the target, False to copy only the data
 
     :raise IOError: On error
     """
-    if not os.path.exists(src):
-        raise IOError(f'"{src}" does not exist.')
-
     src = os.path.abspath(src)
     dest = os.path.abspath(dest)
-    ensure_parent_dir_exists(dest)
-
-    if not ensure_final_newline:
-        shutil.copy2(src, dest)
-    else:
-        with codecs.open(src, mode="r", encoding=encoding) as input:
-            with codecs.open(dest, mode="w", encoding=encoding) as output:
-                last_line_had_nl = False
-                for line in input:
-                    output.write(line)
-                    last_line_had_nl = line[-1] == "\n"
-                if not last_line_had_nl:
-                    output.write("\n")
+    try:
+        _copy_file_data(src, dest)
+    except FileNotFoundError as e:
+        if e.filename == src:
+            raise IOError(f'"{src}" does not exist.')
+        # Most copies go to directories that already exist, so the parent
+        # directory is only checked (and created) when the copy fails.
+        ensure_parent_dir_exists(dest)
+        _copy_file_data(src, dest)
+
+    if ensure_final_newline:
+        _ensure_final_newline(dest, encoding)
+
+    if preserve_metadata:
         shutil.copystat(src, dest)
 
 
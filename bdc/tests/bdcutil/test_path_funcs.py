@@ -1,4 +1,12 @@
-from bdc.bdcutil import find_in_path, joinpath
+from bdc.bdcutil import (
+    find_in_path,
+    joinpath,
+    copy,
+    rm_rf,
+    is_text_file,
+    is_html,
+    is_pdf,
+)
 import os
 import pytest
 
@@ -14,3 +22,96 @@ def test_join_path():
         assert joinpath("a///", "b/") == "a/b"
     else:
         assert True
+
+
+def test_copy(tmp_path):
+    src = tmp_path / "src.bin"
+    data = bytes(range(256)) * 4096
+    src.write_bytes(data)
+    os.chmod(src, 0o640)
+    dest = tmp_path / "a" / "b" / "dest.bin"
+    copy(str(src), str(dest))
+    assert dest.read_bytes() == data
+    assert os.stat(dest).st_mode == os.stat(src).st_mode
+    assert os.stat(dest).st_mtime == os.stat(src).st_mtime
+
+    with pytest.raises(Exception):
+        copy(str(src), str(src))
+    assert src.read_bytes() == data
+
+
+def test_copy_kernel_copy_declined(tmp_path, monkeypatch):
+    # Some file systems report 0 bytes copied, rather than failing.
+    src = tmp_path / "src.bin"
+    data = bytes(range(256)) * 4096
+    src.write_bytes(data)
+    for name in ("copy_file_range", "sendfile"):
+        if hasattr(os, name):
+            monkeypatch.setattr(os, name, lambda *args: 0)
+    dest = tmp_path / "dest.bin"
+    copy(str(src), str(dest))
+    assert dest.read_bytes() == data
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs procfs")
+def test_copy_size_hint(tmp_path):
+    # Files in /proc claim to be empty.
+    dest = tmp_path / "status"
+    copy("/proc/self/status", str(dest))
+    assert dest.read_bytes().startswith(b"Name:")
+
+
+def test_copy_final_newline(tmp_path):
+    src = tmp_path / "src.txt"
+    dest = tmp_path / "dest.txt"
+    for data, expected in (
+        (b"", b"\n"),
+        (b"abc", b"abc\n"),
+        (b"abc\n", b"abc\n"),
+        (b"a\r\nb", b"a\r\nb\n"),
+    ):
+        src.write_bytes(data)
+        copy(str(src), str(dest), ensure_final_newline=True)
+        assert dest.read_bytes() == expected
+
+    src.write_bytes("abc".encode("UTF-16"))
+    copy(str(src), str(dest), ensure_final_newline=True, encoding="UTF-16")
+    assert dest.read_bytes().decode("UTF-16") == "abc\n"
+
+
+def test_file_types():
+    assert is_pdf("foo/bar.pdf")
+    assert is_pdf("BAR.PDF")
+    assert not is_pdf("bar.html")
+    assert is_html("foo.html")
+    assert is_html("foo.HTM")
+    assert not is_html("foo.md")
+    assert is_text_file("foo.md")
+    assert is_text_file("foo.html")
+    assert is_text_file("foo.txt")
+    assert is_text_file("foo.csv")
+    assert not is_text_file("foo.pdf")
+    assert not is_text_file("foo.tar.gz")
+    assert not is_text_file("foo")
+
+
+def test_rm_rf(tmp_path):
+    keep = tmp_path / "keep"
+    keep.mkdir()
+    (keep / "file").write_text("x")
+
+    tree = tmp_path / "tree"
+    (tree / "a" / "b").mkdir(parents=True)
+    (tree / "a" / "b" / "file").write_text("x")
+    (tree / "file").write_text("x")
+    if os.name == "posix":
+        (tree / "a" / "link").symlink_to(keep)
+        (tree / "dangling").symlink_to(tmp_path / "nonexistent")
+
+    rm_rf(str(tree))
+    assert not tree.exists()
+    assert (keep / "file").exists()
+
+    rm_rf(str(tree))  # no error if it doesn't exist
+    rm_rf(str(keep / "file"))
+    assert not (keep / "file").exists()
@@ -0,0 +1,69 @@
+import os
+import stat
+
+from bdc.bdcutil import _pdf_cache_dir, _prune_pdf_cache, _checked_pdf_cache_dir
+import pytest
+
+
+@pytest.fixture
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setenv("BDC_PDF_CACHE", "1")
+    monkeypatch.delenv("BDC_NO_PDF_CACHE", raising=False)
+    _checked_pdf_cache_dir.cache_clear()
+    yield tmp_path
+    _checked_pdf_cache_dir.cache_clear()
+
+
+def test_pdf_cache_dir(cache_home):
+    cache_dir = _pdf_cache_dir()
+    assert cache_dir == os.path.join(str(cache_home), "bdc", "pdf")
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) & 0o077 == 0
+
+
+def test_pdf_cache_dir_disabled(cache_home, monkeypatch):
+    monkeypatch.setenv("BDC_NO_PDF_CACHE", "1")
+    assert _pdf_cache_dir() is None
+    monkeypatch.delenv("BDC_NO_PDF_CACHE")
+    monkeypatch.delenv("BDC_PDF_CACHE")
+    assert _pdf_cache_dir() is None
+    assert not os.path.exists(os.path.join(str(cache_home), "bdc", "pdf"))
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX only")
+def test_pdf_cache_dir_made_private(cache_home):
+    cache_dir = os.path.join(str(cache_home), "bdc", "pdf")
+    os.makedirs(cache_dir)
+    os.chmod(cache_dir, 0o777)
+    assert _pdf_cache_dir() == cache_dir
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_pdf_cache_dir_symlink(cache_home):
+    target = os.path.join(str(cache_home), "elsewhere")
+    os.makedirs(target)
+    os.makedirs(os.path.join(str(cache_home), "bdc"))
+    os.symlink(target, os.path.join(str(cache_home), "bdc", "pdf"))
+    assert _pdf_cache_dir() is None
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "getuid") or os.getuid() != 0, reason="needs root to chown"
+)
+def test_pdf_cache_dir_other_owner(cache_home):
+    cache_dir = os.path.join(str(cache_home), "bdc", "pdf")
+    os.makedirs(cache_dir, mode=0o700)
+    os.chown(cache_dir, 12345, -1)
+    assert _pdf_cache_dir() is None
+
+
+def test_prune_pdf_cache(tmp_path):
+    for i in range(5):
+        path = tmp_path / f"{i}.pdf"
+        path.write_bytes(b"x" * 100)
+        os.utime(str(path), (1000 + i, 1000 + i))
+    (tmp_path / "other").write_bytes(b"x" * 1000)
+
+    _prune_pdf_cache(str(tmp_path), 250)
+    assert sorted(os.listdir(str(tmp_path))) == ["3.pdf", "4.pdf", "other"]
@@ -16,6 +16,12 @@ def test_matches_variable_ref():
             '$foo bar ${nb=="abc"?"one":"two"}',
             ("$foo bar ", '${nb=="abc"?"one":"two"}', ""),
         ),
+        ("nb", "a/$nbx/${nb[1:]}.py", ("a/$nbx/", "${nb[1:]}", ".py")),
+        ("nb", "${nb/a/b/g}-$nb", ("${nb/a/b/g}-", "$nb", "")),
+        ("nb", "$nbx", None),
+        # The forms are tried in order, so ${nb} wins over the later $nb.
+        ("nb", "${nb}-$nb.", ("", "${nb}", "-$nb.")),
+        ("nb", "$$nb\n${nb}", ("$", "$nb", "\n${nb}")),
     ]
 
     for pat, string, expected in data:
@@ -1,4 +1,8 @@
-from bdc.bdcutil import VariableSubstituterParseError, VariableSubstituter
+from bdc.bdcutil import (
+    VariableSubstituterParseError,
+    VariableSubstituter,
+    variable_substituter,
+)
 
 import pytest
 
@@ -144,3 +148,52 @@ def test_variable_substition():
 
     v = VariableSubstituter(r"${file/^\d+-(.*)$/X${bar[0:2]}-$baz.$1/}")
     assert v.substitute({"file": "01-abc", "bar": "tuvw", "baz": "!!"}) == "Xtu-!!.abc"
+
+
+def test_variable_substituter_cache():
+    v = variable_substituter("${foo}-$bar")
+    assert v is variable_substituter("${foo}-$bar")
+    assert v.substitute({"foo": 1, "bar": 2}) == "1-2"
+    assert v.substitute({"foo": 3, "bar": 4}) == "3-4"
+
+    for _ in range(2):
+        with pytest.raises(VariableSubstituterParseError):
+            variable_substituter("${foo $bar")
+
+
+def test_literal_template():
+    assert VariableSubstituter("").substitute({}) == ""
+    assert VariableSubstituter("01-Intro/{x}.py").substitute({}) == "01-Intro/{x}.py"
+    assert VariableSubstituter(r"a\b").substitute({}) == r"a\b"
+    with pytest.raises(VariableSubstituterParseError):
+        VariableSubstituter('a"b')
+
+
+def test_substitute_many():
+    v = VariableSubstituter(r'${a}-${b == "x" ? "X" : "$b"}-${a/(\d)/<$1>/g}')
+    variables = [{"a": "a1b2", "b": "x"}, {"a": 12, "b": "y"}, {"a": "", "b": ""}]
+    assert v.substitute_many(variables) == [v.substitute(d) for d in variables]
+    assert v.substitute_many([]) == []
+    assert VariableSubstituter("abc").substitute_many([{}, {}]) == ["abc", "abc"]
+    with pytest.raises(KeyError):
+        v.substitute_many([{"a": "1", "b": "2"}, {"a": "1"}])
+
+
+def test_simple_template():
+    variables = {"a": "A", "b_1": "B", "1": "one"}
+    v = VariableSubstituter("x$a-${b_1}}$$$1 $${a}")
+    assert v.substitute(variables) == "xA-B}$one ${a}"
+    with pytest.raises(KeyError):
+        v.substitute({"a": "A"})
+    for template in ("a$", "${a", "${ a}", "$-"):
+        with pytest.raises(VariableSubstituterParseError):
+            VariableSubstituter(template).substitute(variables)
+
+
+def test_non_ascii_identifier_chars():
+    # "İ" isn't an identifier character in the grammar, though the re
+    # module's case-blind matching would accept it.
+    assert VariableSubstituter("$aİ").substitute({"a": "A"}) == "Aİ"
+    assert VariableSubstituter("${a}İ").substitute({"a": "A"}) == "Aİ"
+    with pytest.raises(VariableSubstituterParseError):
+        VariableSubstituter("$İ")
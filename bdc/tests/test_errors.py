@@ -0,0 +1,10 @@
+from bdc import BDCError, UnknownFieldsError
+
+
+def test_unknown_fields_error():
+    e = UnknownFieldsError("build", "master", {"bogus"})
+    assert isinstance(e, BDCError)
+    assert e.message == '"build": Bad fields in "master" section: bogus'
+    assert e.args == (e.message,)
+    assert str(e) == e.message
+    assert e.bad_keys == {"bogus"}
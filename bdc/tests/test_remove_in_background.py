@@ -0,0 +1,77 @@
+import errno
+import os
+
+import bdc
+from bdc import _leftover_trash, _remove_in_background
+import pytest
+
+
+def _make_tree(root):
+    os.makedirs(os.path.join(root, "a", "b"))
+    with open(os.path.join(root, "a", "b", "file.txt"), "w") as f:
+        f.write("x\n")
+
+
+def test_remove_in_background(tmp_path):
+    dest = str(tmp_path / "out")
+    _make_tree(dest)
+    future = _remove_in_background(str(tmp_path), [dest, str(tmp_path / "nope")])
+    assert not os.path.exists(dest)
+    future.result()
+    assert os.listdir(str(tmp_path)) == []
+
+    assert _remove_in_background(str(tmp_path), [dest]) is None
+
+
+def test_remove_in_background_error(tmp_path, monkeypatch):
+    dest = str(tmp_path / "out")
+    _make_tree(dest)
+
+    def fail(path):
+        raise PermissionError(13, "Permission denied", path)
+
+    monkeypatch.setattr(bdc, "rm_rf", fail)
+    future = _remove_in_background(str(tmp_path), [dest])
+    with pytest.raises(PermissionError):
+        future.result()
+
+
+def test_remove_in_background_rename_fails(tmp_path, monkeypatch):
+    dest = str(tmp_path / "out")
+    _make_tree(dest)
+    rename_error = None
+
+    def fail(src, dst, *args, **kwargs):
+        raise rename_error
+
+    monkeypatch.setattr(os, "rename", fail)
+    monkeypatch.setattr(os, "replace", fail)
+
+    # A mount point can't be renamed, so it's removed in the foreground.
+    rename_error = OSError(errno.EBUSY, "Device or resource busy", dest)
+    assert _remove_in_background(str(tmp_path), [dest]) is None
+    assert not os.path.exists(dest)
+
+    # Other errors are real errors.
+    _make_tree(dest)
+    rename_error = PermissionError(errno.EACCES, "Permission denied", dest)
+    with pytest.raises(PermissionError):
+        _remove_in_background(str(tmp_path), [dest])
+    assert os.path.exists(dest)
+
+
+def test_leftover_trash(tmp_path, monkeypatch):
+    dest = str(tmp_path / "out")
+    leftover = tmp_path / f".out.bdc-trash-{'0' * 32}"
+    _make_tree(str(leftover))
+    (tmp_path / f".other.bdc-trash-{'0' * 32}").mkdir()
+    (tmp_path / ".out.bdc-trash-mine").mkdir()
+    (tmp_path / ".trash-1234").mkdir()
+    assert _leftover_trash(dest) == [str(leftover)]
+    assert _leftover_trash(str(tmp_path / "nope" / "out")) == []
+
+    # Simulate a run that dies before its trash is deleted.
+    monkeypatch.setattr(bdc, "rm_rf", lambda path: None)
+    os.mkdir(dest)
+    _remove_in_background(str(tmp_path), [dest]).result()
+    assert len(_leftover_trash(dest)) == 2
@@ -9,7 +9,7 @@ from textwrap import TextWrapper
 import os
 import sys
 from itertools import dropwhile
-from typing import Optional, NoReturn, Generator
+from typing import Optional, NoReturn, Generator, Union
 import itertools
 from contextlib import contextmanager
 
@@ -67,6 +67,16 @@ class EnhancedTextWrapper(TextWrapper):
         TextWrapper.__init__(self, width=width, subsequent_indent=subsequent_indent)
 
     def fill(self, msg):
+        if 0 < len(msg) <= self.width and msg.isprintable() and msg[-1] != " ":
+            # Most messages fit on one line. With no tabs, newlines or other
+            # special characters to convert, and no trailing space to drop,
+            # wrapping would return the message unchanged.
+            return msg
+
+        if "\n" not in msg:
+            # The common case: There's nothing to split and rejoin.
+            return TextWrapper.fill(self, msg)
+
         wrapped = [TextWrapper.fill(self, line) for line in msg.split("\n")]
         return "\n".join(wrapped)
 
@@ -77,6 +87,7 @@ class EnhancedTextWrapper(TextWrapper):
 
 _verbose = False
 _verbose_wrapper = None
+_verbose_wrappers = {}
 _verbose_prefix = ""
 _debug = False
 _ERROR_PREFIX = "ERROR: "
@@ -102,6 +113,23 @@ _no_prefix_wrapper = EnhancedTextWrapper(width=_COLUMNS)
 # Private Functions
 # -----------------------------------------------------------------------------
 
+
+def _resolve_msg(msg: Union[str, Callable[[], str]]) -> str:
+    """
+    Messages passed to verbose() and debug() can be either strings or
+    zero-argument callables that produce strings. The latter allows callers
+    to defer expensive message formatting until it's known that the message
+    will actually be emitted.
+
+    :param msg: the message or message-producing callable
+
+    :return: the message string
+    """
+    if callable(msg):
+        return msg()
+    return msg
+
+
 # -----------------------------------------------------------------------------
 # Public Functions
 # -----------------------------------------------------------------------------
@@ -156,7 +184,13 @@ def set_verbosity(verbose: bool, verbose_prefix: Optional[str] = None) -> NoRetu
             _verbose_prefix = verbose_prefix
             indent = " " * len(verbose_prefix)
 
-        _verbose_wrapper = EnhancedTextWrapper(subsequent_indent=indent)
+        # Wrappers are stateless between fill() calls, so reuse one if we've
+        # already built it for this width and indentation.
+        key = (os.environ.get("COLUMNS"), indent)
+        _verbose_wrapper = _verbose_wrappers.get(key)
+        if _verbose_wrapper is None:
+            _verbose_wrapper = EnhancedTextWrapper(subsequent_indent=indent)
+            _verbose_wrappers[key] = _verbose_wrapper
 
 
 def verbosity_is_enabled() -> bool:
@@ -178,24 +212,27 @@ def wrap2stdout(msg: str) -> NoReturn:
     print(_no_prefix_wrapper.fill(msg))
 
 
-def verbose(msg: str) -> NoReturn:
+def verbose(msg: Union[str, Callable[[], str]]) -> NoReturn:
     """
     Conditionally emit a verbose message. See also set_verbosity().
 
-    :param msg: the message
+    :param msg: the message, or a zero-argument callable that returns the
+                message. The callable is only invoked if verbosity is enabled,
+                so it's a cheap way to defer expensive formatting.
     """
     if _verbose:
-        print(_verbose_wrapper.fill(f"{_verbose_prefix}{msg}"))
+        print(_verbose_wrapper.fill(f"{_verbose_prefix}{_resolve_msg(msg)}"))
 
 
-def debug(msg: str) -> NoReturn:
+def debug(msg: Union[str, Callable[[], str]]) -> NoReturn:
     """
     Conditionally emit a debug message.
 
-    :param msg: the message
+    :param msg: the message, or a zero-argument callable that returns the
+                message. The callable is only invoked if debugging is enabled.
     """
     if _debug:
-        print(_debug_wrapper.fill(f"{_DEBUG_PREFIX}{msg}"))
+        print(_debug_wrapper.fill(f"{_DEBUG_PREFIX}{_resolve_msg(msg)}"))
 
 
 def warn(msg: str) -> NoReturn:
@@ -0,0 +1,24 @@
+from db_edu_util import verbose, set_verbosity
+
+
+def test_verbose_callable(capsys):
+    calls = []
+
+    def msg():
+        calls.append(1)
+        return "deferred message"
+
+    set_verbosity(False)
+    verbose(msg)
+    assert calls == []
+    assert capsys.readouterr().out == ""
+
+    set_verbosity(True)
+    try:
+        verbose(msg)
+        verbose("plain message")
+    finally:
+        set_verbosity(False)
+
+    assert calls == [1]
+    assert capsys.readouterr().out == "deferred message\nplain message\n"
@@ -62,3 +62,12 @@ def test_wrap():
            |incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam,
            |quis nostrud exercitation"""
     )
+
+
+def test_wrap_short():
+    e = EnhancedTextWrapper(width=20)
+    assert e.fill("fits on one line") == "fits on one line"
+    assert e.fill("   leading space") == "   leading space"
+    assert e.fill("trailing space   ") == "trailing space"
+    assert e.fill("tab\there") == "tab     here"
+    assert e.fill("") == ""
@@ -11,11 +11,11 @@ import os
 import sys
 import docopt
 import traceback
-import codecs
-import shutil
-from zipfile import ZipFile
+import posixpath
+import stat
+import time
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
 from dataclasses import dataclass
-from tempfile import TemporaryDirectory
 
 from typing import Sequence, Optional, NoReturn, Dict, Any
 
@@ -39,7 +39,7 @@ __all__ = ["Config", "GendbcError", "gendbc"]
 # Constants
 # -----------------------------------------------------------------------------
 
-VERSION = "2.1.2"
+VERSION = "2.2.0"
 
 PROG = os.path.basename(sys.argv[0])
 
@@ -102,6 +102,7 @@ class Config:
     encoding: str = "UTF-8"
     flatten: bool = False
     show_stack: bool = True
+    compresslevel: Optional[int] = None
 
 
 class GendbcError(Exception):
@@ -234,37 +235,50 @@ def _write_dbc(notebooks: Sequence[Notebook], params: Config) -> NoReturn:
     :return: None
     """
 
-    # The simplest solution is to write the JSON versions of the notebooks to
-    # a temporary directory and use shutil.make_archive() to do the heavy
-    # lifting.
+    # Write the JSON versions of the notebooks straight into the zip file.
+    # The DBC gets the same entries shutil.make_archive() would produce from
+    # a directory of JSON files (including explicit directory entries), but
+    # the JSON never has to be written to, and read back from, the disk.
     dbc_paths = _adjust_paths(notebooks, params)
-    with TemporaryDirectory() as tempdir:
+    timestamp = time.localtime()[:6]
+
+    def zip_info(name: str, mode: int, compress_type: int) -> ZipInfo:
+        zi = ZipInfo(name, date_time=timestamp)
+        zi.external_attr = mode << 16
+        zi.compress_type = compress_type
+        return zi
+
+    with ZipFile(params.dbc, "w") as z:
+        dirs_written = set()
         for nb, zpath in zip(notebooks, dbc_paths):
             json = nb.to_json()
             # Wrinkle: Python JSON notebooks end in ".python", not ".py".
             file, ext = os.path.splitext(zpath)
             if ext == ".py":
                 zpath = f"{file}.python"
-            out_path = os.path.join(tempdir, zpath)
-            dirname = os.path.dirname(zpath)
-            if dirname and (dirname != "."):
-                dirpath = os.path.join(tempdir, dirname)
-                if not os.path.exists(dirpath):
-                    os.makedirs(dirpath)
-            with codecs.open(out_path, mode="w", encoding=params.encoding) as w:
-                w.write(json)
-            verbose(f'Wrote JSON notebook "{out_path}".')
-
-        # Create the zip file.
-        shutil.make_archive(params.dbc, "zip", root_dir=tempdir)
-
-        # make_archive() just created "something.dbc.zip". Rename it.
-        os.rename(params.dbc + ".zip", params.dbc)
+            zpath = os.path.normpath(zpath).replace(os.sep, "/")
+
+            # Add entries for any parent directories not yet in the zip.
+            parents = []
+            dirname = posixpath.dirname(zpath)
+            while dirname and (dirname not in dirs_written):
+                parents.append(dirname)
+                dirs_written.add(dirname)
+                dirname = posixpath.dirname(dirname)
+            for d in reversed(parents):
+                zi = zip_info(f"{d}/", stat.S_IFDIR | 0o755, ZIP_STORED)
+                zi.external_attr |= 0x10  # MS-DOS directory flag
+                z.writestr(zi, b"")
+
+            z.writestr(
+                zip_info(zpath, stat.S_IFREG | 0o644, ZIP_DEFLATED),
+                json.encode(params.encoding),
+                compresslevel=params.compresslevel,
+            )
+            verbose(f'Wrote JSON notebook "{zpath}" to "{params.dbc}".')
 
-        # Finally, make_archive() did NOT create a comment in the zip file.
-        # Let's add one, to indicate who created the DBC.
-        with ZipFile(params.dbc, "a") as z:
-            z.comment = f"gendbc (Python), version {VERSION}".encode("ascii")
+        # Add a comment to the zip file, to indicate who created the DBC.
+        z.comment = f"gendbc (Python), version {VERSION}".encode("ascii")
 
 
 # -----------------------------------------------------------------------------
@@ -280,6 +294,7 @@ def gendbc(
     flatten: bool,
     verbose: bool,
     debugging: bool = False,
+    compresslevel: Optional[int] = None,
 ) -> NoReturn:
     """
     Generate a DBC from all the notebooks under a specific source directory.
@@ -295,6 +310,9 @@ def gendbc(
                         of the DBC.
     :param verbose:     Whether or not to emit verbose messages.
     :param debugging:   Whether or not to emit debug messages.
+    :param compresslevel: The zlib compression level (0-9) to use for the
+                        notebooks in the DBC, or None for the zlib default.
+                        Lower levels are faster but produce bigger DBCs.
 
     :return: nothing
     """
@@ -307,6 +325,7 @@ def gendbc(
         show_stack=True,
         source_dir=source_dir,
         dbc=dbc_path,
+        compresslevel=compresslevel,
     )
 
     if params.dbc_folder and ("/" in params.dbc_folder):
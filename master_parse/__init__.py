@@ -808,7 +808,7 @@ class NotebookGenerator(object):
                     ):
                         # This cell is not in the right profile.
                         debug(
-                            f'"{input_name}", cell #{cell_num}: Build '
+                            lambda: f'"{input_name}", cell #{cell_num}: Build '
                             + f'profile is "{params.active_profile.name}", '
                             + f"but cell is only valid in "
                             + f'{", ".join(profiles)} profile(s). Skipping '
@@ -1781,7 +1781,7 @@ class Parser:
 
         def extend_content(cell_state):
             debug(
-                f'Notebook "{file_name}": Cell at line '
+                lambda: f'Notebook "{file_name}": Cell at line '
                 + f"{cell_state.starting_line_number} matches "
                 + f"labels {[l.value for l in cell_state.command_labels]}."
             )